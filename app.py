@@ -2,112 +2,21 @@ import pandas as pd
 import streamlit as st
 import plotly.express as px
 import plotly.graph_objects as go
-from datetime import datetime, timedelta
-import numpy as np
-from sklearn.linear_model import LinearRegression
-from sklearn.preprocessing import PolynomialFeatures
+from datetime import datetime
 import os
-
-def getFilteredData(
-    file_path,
-    gender=None,
-    age=None,
-    units_sold=None,
-    price=None,
-    item_type=None,
-    city=None,
-    discount_applied=None,
-    return_status=None,
-    date_of_purchase=None,
-    payment_method=None
-):
-    try:
-        df = pd.read_csv(file_path)
-    except FileNotFoundError:
-        print(f"Error: File '{file_path}' not found.")
-        return None
-    except Exception as e:
-        print(f"Error reading the CSV file: {e}")
-        return None
-
-    # Convert 'Date of Purchase' to datetime (DD-MM-YYYY format)
-    if 'date_of_purchase' in df.columns:
-        df['date_of_purchase'] = pd.to_datetime(df['date_of_purchase'], format='%d-%m-%Y', errors='coerce')
-
-    if gender is not None:
-        df = df[df['gender'] == gender]
-
-    if age is not None:
-        try:
-            min_age, max_age = map(float, age.split('-'))
-            df['age'] = pd.to_numeric(df['age'], errors='coerce')
-            df = df.dropna(subset=['age'])
-            df = df[(df['age'] >= min_age) & (df['age'] <= max_age)]
-        except Exception as e:
-            print(f"Invalid age range: {age}. Error: {e}")
-
-    if units_sold is not None:
-        try:
-            min_units, max_units = map(float, units_sold.split('-'))
-            df['units_sold'] = pd.to_numeric(df['units_sold'], errors='coerce')
-            df = df.dropna(subset=['units_sold'])
-            df = df[(df['units_sold'] >= min_units) & (df['units_sold'] <= max_units)]
-        except Exception as e:
-            print(f"Invalid units sold range: {units_sold}. Error: {e}")
-
-    if price is not None:
-        try:
-            min_price, max_price = map(float, price.split('-'))
-            df['price'] = pd.to_numeric(df['price'], errors='coerce')
-            df = df.dropna(subset=['price'])
-            df = df[(df['price'] >= min_price) & (df['price'] <= max_price)]
-        except Exception as e:
-            print(f"Invalid price range: {price}. Error: {e}")
-
-    if item_type is not None:
-        df = df[df['item_type'] == item_type]
-
-    if city is not None:
-        df = df[df['city'] == city]
-
-    if discount_applied is not None:
-        df = df[df['discount_applied'] == discount_applied]
-
-    if return_status is not None:
-        df = df[df['return_status'] == return_status]
-
-    if date_of_purchase is not None:
-        # Handle date range filter if the input is in the format "start_date to end_date"
-        try:
-            if 'to' in date_of_purchase:
-                start_date, end_date = date_of_purchase.split(' to ')
-                start_date = pd.to_datetime(start_date, format='%d-%m-%Y')
-                end_date = pd.to_datetime(end_date, format='%d-%m-%Y')
-                df = df[(df['date_of_purchase'] >= start_date) & (df['date_of_purchase'] <= end_date)]
-            else:
-                # Exact date match
-                date_value = pd.to_datetime(date_of_purchase, format='%d-%m-%Y')
-                df = df[df['date_of_purchase'] == date_value]
-        except Exception as e:
-            print(f"Invalid date range: {date_of_purchase}. Error: {e}")
-
-    if payment_method is not None:
-        df = df[df['payment_method'] == payment_method]
-
-    # Show filtered result
-    print("\nFiltered Dataset:")
-    print(df)
-
-    # Calculate and display total profit
-    if 'profit' in df.columns:
-        df['profit'] = pd.to_numeric(df['profit'], errors='coerce').fillna(0)
-        total_profit = df['profit'].sum()
-        print(f"\nTotal Profit for filtered data: {total_profit}")
-    else:
-        print("\n'Profit' column not found in the dataset.")
-
-    return df
-
+import uuid
+from ingest import load_cached_csv, read_sales_csv, optimize_dtypes, sort_by_date, stream_sales_csv, file_key, server_path, STREAM_THRESHOLD_BYTES, SERVER_DATA_ROOT
+from cube import filter_cube, rollup, totals, share, age_groups
+from datasets import DatasetRegistry
+from result_cache import ResultCache, filter_key
+from forecasting import forecast_series, batch_forecast
+from charts import downsample, histogram_bins, binned_histogram
+from table import PAGE_SIZES, sort_order, sorted_positions, page_positions
+from export import EXPORT_FORMATS, export_rows
+from synthetic import generate_sales
+from instrumentation import SpanRecorder
+from watcher import DirectoryWatcher, WATCH_INTERVAL
+from sampling import Refiner, APPROX_MIN_ROWS, REFINE_POLL_SECONDS
 
 # Set page configuration
 st.set_page_config(
@@ -336,84 +245,159 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
-# Initialize session state for data
-if 'data' not in st.session_state:
-    st.session_state.data = None
+# Initialize session state for data. A session only holds a handle to a
+# dataset shared by every session that opened the same content.
+if 'dataset' not in st.session_state:
+    st.session_state.dataset = None
+# Number of appends so far; a new count gives the append uploader a fresh
+# key so the same file is not appended twice
+if 'appends' not in st.session_state:
+    st.session_state.appends = 0
+# Directory the session's dataset is kept in sync with, if any
+if 'watch_dir' not in st.session_state:
+    st.session_state.watch_dir = None
+# Identifies the session's background refinements
+if 'refine_owner' not in st.session_state:
+    st.session_state.refine_owner = uuid.uuid4().hex
+
+# Loaded datasets shared by all sessions, keyed by content
+@st.cache_resource
+def get_datasets():
+    return DatasetRegistry()
+
+datasets = get_datasets()
 
 # Load data function
-@st.cache_data
 def load_data(file):
     try:
-        df = pd.read_csv(file)
-        df['Date'] = pd.to_datetime(df['Date'])
-        return df
+        return datasets.open(file_key(file), lambda: (load_cached_csv(file), None))
     except Exception as e:
         st.error(f"Error loading data: {e}")
         return None
 
+# Append new rows to an open dataset. Only the new rows are parsed,
+# aggregated and indexed.
+def append_data(handle, file):
+    try:
+        return datasets.append(handle, read_sales_csv(file), file_key(file))
+    except Exception as e:
+        st.error(f"Error appending data: {e}")
+        return None
+
+# Sample data: a year of synthetic sales with many orders per day
+SAMPLE_ROWS = 10_000
+
 # Load sample data function
-@st.cache_data
 def load_sample_data():
     try:
-        n_records = 1000
-        data = {
-            'Date': pd.date_range(start='2023-01-01', periods=n_records),
-            'Gender': np.random.choice(['Male', 'Female'], n_records),
-            'Age': np.random.randint(18, 70, n_records),
-            'City': np.random.choice(['New York', 'Los Angeles', 'Chicago', 'Houston', 'Phoenix'], n_records),
-            'ItemType': np.random.choice(['Electronics', 'Clothing', 'Food', 'Books', 'Home'], n_records),
-            'Price': np.random.uniform(10, 1000, n_records).round(2),
-            'UnitsSold': np.random.randint(1, 10, n_records),
-            'Payment': np.random.choice(['Credit Card', 'Debit Card', 'Cash', 'Digital Wallet'], n_records),
-            'Return': np.random.choice(['Returned', 'Not Returned'], n_records, p=[0.1, 0.9]),
-            'Discount': np.random.choice(['Yes', 'No'], n_records, p=[0.2, 0.8]),
-            'Feedback': np.random.uniform(1, 5, n_records).round(1)
-        }
-        
-        df = pd.DataFrame(data)
-        df['Profit'] = (df['Price'] * df['UnitsSold'] * 0.3).round(2)  # 30% profit margin
-        return df
+        return datasets.open(
+            f"sample-{SAMPLE_ROWS}",
+            lambda: (sort_by_date(optimize_dtypes(generate_sales(SAMPLE_ROWS))), None)
+        )
     except Exception as e:
         st.error(f"Error loading sample data: {e}")
         return None
 
-# Forecasting function
-def forecast_sales(data, days_to_forecast=30, metric='Price'):
-    # Prepare data
-    data = data.sort_values('Date')
-    X = np.array(range(len(data))).reshape(-1, 1)
-    y = data[metric].values
-    
-    # Create polynomial features
-    poly = PolynomialFeatures(degree=2)
-    X_poly = poly.fit_transform(X)
-    
-    # Fit model
-    model = LinearRegression()
-    model.fit(X_poly, y)
-    
-    # Generate future dates
-    last_date = data['Date'].max()
-    future_dates = pd.date_range(start=last_date + timedelta(days=1), periods=days_to_forecast)
-    
-    # Predict
-    future_X = np.array(range(len(data), len(data) + days_to_forecast)).reshape(-1, 1)
-    future_X_poly = poly.transform(future_X)
-    predictions = model.predict(future_X_poly)
-    
-    return future_dates, predictions
+# Dashboard result cache shared by all sessions
+@st.cache_resource
+def get_result_cache():
+    return ResultCache()
+
+# Section timings shared by all sessions
+@st.cache_resource
+def get_timings():
+    return SpanRecorder()
+
+timings = get_timings()
+span = timings.span
+
+# Background computation of exact results, shared by all sessions
+@st.cache_resource
+def get_refiner():
+    return Refiner()
+
+# Directory watchers, one per directory, shared by all sessions. Each keeps
+# ingesting new drops in a background thread.
+@st.cache_resource
+def get_watcher(path):
+    return DirectoryWatcher(path, datasets).start()
+
+# Open the dataset of a watched directory, loading it on first use
+def watch_data(path):
+    try:
+        with st.spinner("Reading data directory..."):
+            return get_watcher(path).open()
+    except Exception as e:
+        st.error(f"Error watching directory: {e}")
+        return None
+
+# Stream a large file into the aggregate cube, reporting progress as it reads
+def stream_data(file):
+    progress_bar = st.progress(0.0, text="Reading data...")
+
+    def load():
+        data_cube, source = stream_sales_csv(
+            file,
+            progress=lambda done: progress_bar.progress(done, text=f"Reading data... {done:.0%}")
+        )
+        return None, data_cube, source
+
+    try:
+        return datasets.open(f"stream-{file_key(file)}", load)
+    except Exception as e:
+        st.error(f"Error loading data: {e}")
+        return None
+    finally:
+        progress_bar.empty()
 
 # Main app
 st.markdown("<h1 style='text-align: center; font-size: 3rem; color: #1f77b4;'>📊 Revify</h1>", unsafe_allow_html=True)
 
 # Add a button to reset/upload new data in the sidebar
-if st.session_state.data is not None:
+if st.session_state.dataset is not None:
     if st.sidebar.button("Upload New Data"):
-        st.session_state.data = None
+        st.session_state.dataset.release()
+        st.session_state.dataset = None
+        st.session_state.watch_dir = None
         st.rerun()
 
+    if st.session_state.watch_dir is not None:
+        watcher = get_watcher(st.session_state.watch_dir)
+
+        # Switch to each new version of the watched data as it is ingested.
+        # Only this check reruns on the timer; the dashboard reruns when
+        # the data changed.
+        @st.fragment(run_every=WATCH_INTERVAL)
+        def watch_status():
+            if watcher.version not in (None, st.session_state.dataset.key):
+                dataset = watcher.open()
+                if dataset is not None:
+                    st.session_state.dataset.release()
+                    st.session_state.dataset = dataset
+                    st.rerun(scope="app")
+            status = watcher.status()
+            st.caption(f"Watching {watcher.path}: {status['files']:,} files, {status['rows'] or 0:,} rows")
+            if status['last_update'] is not None:
+                st.caption(f"Last update at {datetime.fromtimestamp(status['last_update']):%H:%M:%S}")
+            if status['last_error']:
+                st.warning(f"Some files were skipped: {status['last_error']}")
+
+        with st.sidebar:
+            watch_status()
+    else:
+        # Add the latest rows, e.g. a day's sales, without reloading the history
+        with st.sidebar.expander("Append Data"):
+            new_rows_file = st.file_uploader("New rows (CSV)", type="csv", key=f"append_{st.session_state.appends}")
+            if new_rows_file is not None and st.button("Append Rows"):
+                dataset = append_data(st.session_state.dataset, new_rows_file)
+                if dataset is not None:
+                    st.session_state.dataset.release()
+                    st.session_state.dataset = dataset
+                    st.session_state.appends += 1
+                    st.rerun()
+
 # File upload section
-if st.session_state.data is None:
+if st.session_state.dataset is None:
     st.markdown("""
         <div class="info-box">
             <h2 style='text-align: center; color: #1f77b4;'>Welcome to Revify</h2>
@@ -502,30 +486,95 @@ if st.session_state.data is None:
     
     with col2:
         st.markdown("<div style='text-align: center; margin-top: 1rem;'>", unsafe_allow_html=True)
+        # Server paths are only offered inside REVIFY_SERVER_DATA_ROOT
+        large_file_path = watch_path = None
+        stream_clicked = watch_clicked = False
+        if SERVER_DATA_ROOT:
+            # Files too large to upload can be streamed from disk in chunks
+            large_file_path = st.text_input("Or stream a large CSV from a server path")
+            stream_clicked = st.button("Stream Large File", use_container_width=True)
+            # A directory of CSV/Parquet drops is kept up to date as files arrive
+            watch_path = st.text_input("Or watch a server directory of sales files")
+            watch_clicked = st.button("Watch Directory", use_container_width=True)
         st.markdown("</div>", unsafe_allow_html=True)
     
     # Add Load Sample Data button below upload section
     st.markdown("<div style='text-align: center; margin-top: 1rem;'>", unsafe_allow_html=True)
     if st.button("📊 Load Sample Data", use_container_width=True):
-        df = load_sample_data()
-        if df is not None:
-            st.session_state.data = df
+        dataset = load_sample_data()
+        if dataset is not None:
+            st.session_state.dataset = dataset
             st.success("Sample data loaded successfully!")
             st.balloons()
             st.rerun()
     st.markdown("</div>", unsafe_allow_html=True)
     
+    if stream_clicked and large_file_path:
+        try:
+            resolved_path = server_path(large_file_path)
+        except ValueError as e:
+            st.error(str(e))
+        else:
+            if os.path.isfile(resolved_path):
+                dataset = stream_data(resolved_path)
+                if dataset is not None:
+                    st.session_state.dataset = dataset
+                    st.success("Data streamed successfully!")
+                    st.rerun()
+            else:
+                st.error(f"File '{large_file_path}' not found.")
+
+    if watch_clicked and watch_path:
+        try:
+            resolved_path = server_path(watch_path)
+        except ValueError as e:
+            st.error(str(e))
+        else:
+            if os.path.isdir(resolved_path):
+                dataset = watch_data(resolved_path)
+                if dataset is not None:
+                    st.session_state.dataset = dataset
+                    st.session_state.watch_dir = resolved_path
+                    st.success("Watching directory!")
+                    st.rerun()
+            else:
+                st.error(f"Directory '{watch_path}' not found.")
+
     if uploaded_file is not None:
-        df = load_data(uploaded_file)
-        if df is not None:
-            st.session_state.data = df
-            st.success("Data loaded successfully!")
-            st.balloons()
-            st.rerun()
+        if uploaded_file.size > STREAM_THRESHOLD_BYTES:
+            # Large uploads are aggregated chunk by chunk instead of held in memory
+            dataset = stream_data(uploaded_file)
+            if dataset is not None:
+                st.session_state.dataset = dataset
+                st.success("Data streamed successfully!")
+                st.rerun()
+        else:
+            dataset = load_data(uploaded_file)
+            if dataset is not None:
+                st.session_state.dataset = dataset
+                st.success("Data loaded successfully!")
+                st.balloons()
+                st.rerun()
+
+# Show dashboard if data is loaded. Streamed datasets only have the
+# aggregate cube, so sections that need individual rows are skipped.
+if st.session_state.dataset is not None:
+    dataset = st.session_state.dataset.dataset
+    df = dataset.data
+    # Content key of the dataset, used in result cache keys
+    dataset_key = dataset.key
+    # Aggregate cube over every category combination per day and the row
+    # filter index, built once per dataset and shared across sessions;
+    # charts and metrics are derived from the cube
+    with span('dataset_indexes'):
+        data_cube = dataset.cube
+        filter_index = dataset.filter_index
+    # Filters and aggregations run on the configured query backend, which
+    # is kept with the shared dataset
+    backend = dataset.backend
 
-# Show dashboard if data is loaded
-if st.session_state.data is not None:
-    df = st.session_state.data
+    if df is None:
+        st.info("This dataset was streamed from disk in chunks. Charts are built from pre-aggregated data, so row-level views are not available.")
     
     # Sidebar filters
     st.sidebar.title("Filters")
@@ -533,479 +582,668 @@ if st.session_state.data is not None:
     # Date range filter
     date_range = st.sidebar.date_input(
         "Select Date Range",
-        [df['Date'].min(), df['Date'].max()]
+        [data_cube['Date'].min(), data_cube['Date'].max()]
     )
     
     # Gender filter with "All" option and multiple selection
-    gender_options = ['All'] + list(df['Gender'].unique())
+    gender_options = ['All'] + list(data_cube['Gender'].dropna().unique())
     gender_filter = st.sidebar.multiselect(
         "Select Gender (can select multiple)",
         options=gender_options,
         default=['All']
     )
     if 'All' in gender_filter:
-        gender_filter = df['Gender'].unique()
+        gender_filter = None
     
     # City filter with "All" option and multiple selection
-    city_options = ['All'] + list(df['City'].unique())
+    city_options = ['All'] + list(data_cube['City'].dropna().unique())
     city_filter = st.sidebar.multiselect(
         "Select City (can select multiple)",
         options=city_options,
         default=['All']
     )
     if 'All' in city_filter:
-        city_filter = df['City'].unique()
+        city_filter = None
 
     # Item Type filter with "All" option and multiple selection
-    item_type_options = ['All'] + list(df['ItemType'].unique())
+    item_type_options = ['All'] + list(data_cube['ItemType'].dropna().unique())
     item_type_filter = st.sidebar.multiselect(
         "Select Item Type (can select multiple)",
         options=item_type_options,
         default=['All']
     )
     if 'All' in item_type_filter:
-        item_type_filter = df['ItemType'].unique()
-
-    # Price range filter
-    min_price = float(df['Price'].min())
-    max_price = float(df['Price'].max())
-    price_range = st.sidebar.slider(
-        "Price Range",
-        min_value=min_price,
-        max_value=max_price,
-        value=(min_price, max_price)
-    )
+        item_type_filter = None
 
-    # Age range filter
-    min_age = int(df['Age'].min())
-    max_age = int(df['Age'].max())
-    age_range = st.sidebar.slider(
-        "Age Range",
-        min_value=min_age,
-        max_value=max_age,
-        value=(min_age, max_age)
-    )
+    selections = {
+        col: values for col, values in [
+            ('Gender', gender_filter),
+            ('City', city_filter),
+            ('ItemType', item_type_filter)
+        ] if values is not None
+    }
 
-    # Apply filters
-    mask = (
-        (df['Date'].dt.date >= date_range[0]) &
-        (df['Date'].dt.date <= date_range[1]) &
-        (df['Gender'].isin(gender_filter)) &
-        (df['City'].isin(city_filter)) &
-        (df['ItemType'].isin(item_type_filter)) &
-        (df['Price'] >= price_range[0]) &
-        (df['Price'] <= price_range[1]) &
-        (df['Age'] >= age_range[0]) &
-        (df['Age'] <= age_range[1])
-    )
-    filtered_df = df[mask]
+    price_bounds = backend.value_range('Price')
+    age_bounds = backend.value_range('Age')
+    if price_bounds is not None and age_bounds is not None:
+        # Price range filter
+        min_price = float(price_bounds[0])
+        max_price = float(price_bounds[1])
+        price_range = st.sidebar.slider(
+            "Price Range",
+            min_value=min_price,
+            max_value=max_price,
+            value=(min_price, max_price)
+        )
 
-    # Key metrics
-    col1, col2, col3, col4 = st.columns(4)
-    
-    with col1:
-        st.metric(
-            "Total Sales",
-            f"${filtered_df['Price'].sum():,.2f}",
-            f"{((filtered_df['Price'].sum() / df['Price'].sum() - 1) * 100):,.1f}%"
+        # Age range filter
+        min_age = int(age_bounds[0])
+        max_age = int(age_bounds[1])
+        age_range = st.sidebar.slider(
+            "Age Range",
+            min_value=min_age,
+            max_value=max_age,
+            value=(min_age, max_age)
         )
-    
-    with col2:
-        st.metric(
-            "Total Profit",
-            f"${filtered_df['Profit'].sum():,.2f}",
-            f"{((filtered_df['Profit'].sum() / df['Profit'].sum() - 1) * 100):,.1f}%"
+
+    else:
+        price_range = None
+        age_range = None
+
+    # Very large datasets first show estimates from a sample and refine
+    # them to exact values in the background
+    approximate_mode = False
+    if df is not None and len(df) >= APPROX_MIN_ROWS:
+        approximate_mode = st.sidebar.toggle(
+            "Fast approximate results",
+            value=True,
+            help="Show estimates from a stratified sample right away while exact results are computed"
         )
-    
-    with col3:
-        st.metric(
-            "Units Sold",
-            f"{filtered_df['UnitsSold'].sum():,}",
-            f"{((filtered_df['UnitsSold'].sum() / df['UnitsSold'].sum() - 1) * 100):,.1f}%"
+
+    # Section results are cached across reruns and sessions, keyed by the
+    # dataset and the normalized filter state
+    result_cache = get_result_cache()
+    view_key = (dataset_key, filter_key(date_range, selections, price_range, age_range))
+    # Key of this run's section results; results derived from estimates are
+    # kept apart from exact ones
+    result_key = view_key
+
+    # Compute a section result once per filter state and parameters
+    def cached(section, compute, *params):
+        return result_cache.get_or_compute(result_key + (section,) + params, compute)
+
+    # Roll the filtered cube up through the result cache
+    def cube_rollup(by, measures=('Price',), agg='sum'):
+        by = (by,) if isinstance(by, str) else tuple(by)
+        return cached('rollup', lambda: rollup(filtered_cube, list(by), measures, agg), by, tuple(measures), agg)
+
+    # Thin a daily series to about one point per pixel before it is sent to
+    # the browser. Peaks and troughs of the given columns are kept.
+    def chart_points(section, frame, columns, *params):
+        return cached(section, lambda: downsample(frame, 'Date', list(columns)), tuple(columns), *params)
+
+    # Tell the user when a chart shows fewer days than the data holds
+    def points_note(points, frame):
+        if len(points) < len(frame):
+            st.caption(f"Showing {len(points):,} of {len(frame):,} days. Narrow the date range to see every point.")
+
+    ranges = {
+        'Price': price_range,
+        'Age': age_range
+    }
+
+    # Shares shown in the overview, with their confidence margins when estimated
+    share_metrics = [('Return', 'Returned'), ('Discount', 'Yes')]
+    # 95% confidence margins of estimated metrics; None for exact results
+    intervals = None
+    refiner = get_refiner()
+    estimating = approximate_mode and not refiner.done(view_key)
+
+    # The matching rows and the exact cube, computed in the background.
+    # The refiner keeps them even when they are too large for the result
+    # cache, so the exact rerun never repeats the scan.
+    def refine():
+        positions = result_cache.get_or_compute(
+            view_key + ('rows',),
+            lambda: backend.row_positions(date_range, selections, ranges)
         )
-    
-    with col4:
-        st.metric(
-            "Average Feedback",
-            f"{filtered_df['Feedback'].mean():.1f}",
-            f"{((filtered_df['Feedback'].mean() / df['Feedback'].mean() - 1) * 100):,.1f}%"
+        cube = result_cache.get_or_compute(
+            view_key + ('cube',),
+            lambda: backend.filtered_cube(date_range, selections, ranges, positions)
         )
+        return positions, cube
+
+    # Exact results finished in the background for this filter state
+    refined = None
+    if approximate_mode and not estimating:
+        try:
+            refined = refiner.result(view_key)
+        except Exception as e:
+            st.warning(f"Exact results could not be computed in the background ({e}); computing them now.")
+
+    if estimating:
+        # Row-level views wait for the background results
+        refiner.submit(view_key, refine, owner=st.session_state.refine_owner)
+        row_positions = None
+
+        with span('filter_cube'):
+            if backend.answers_from_cube(selections, ranges):
+                filtered_cube = cached('cube', lambda: backend.filtered_cube(date_range, selections, ranges))
+            else:
+                sample = dataset.sample
+                result_key = view_key + ('estimate',)
+                filtered_cube, intervals = cached(
+                    'estimate',
+                    lambda: sample.estimate(date_range, selections, ranges, share_metrics)
+                )
+    elif refined is not None:
+        row_positions, filtered_cube = refined
+    else:
+        # Apply filters through the backend; "All" selections and full
+        # slider ranges are skipped without touching the data
+        with span('filter_rows'):
+            row_positions = cached('rows', lambda: backend.row_positions(date_range, selections, ranges))
+
+        with span('filter_cube'):
+            filtered_cube = cached('cube', lambda: backend.filtered_cube(date_range, selections, ranges, row_positions))
+
+    # Matching rows, restricted to the columns a section uses. Rows are
+    # only sliced by the sections that need them, so a rerun never copies
+    # every column of the memory-mapped data.
+    def filtered_rows(columns):
+        return df.iloc[row_positions, df.columns.get_indexer(list(columns))]
+
+    overall = result_cache.get_or_compute((dataset_key, 'totals'), lambda: totals(data_cube))
+    current = cached('totals', lambda: totals(filtered_cube))
+
+    # A metric value with its 95% confidence margin when it is estimated
+    def with_margin(text, key, fmt):
+        if intervals is None or key not in intervals:
+            return text
+        return f"{text} ± {fmt(intervals[key])}"
+
+    if estimating:
+        # Rerun with the exact results as soon as they are ready
+        @st.fragment(run_every=REFINE_POLL_SECONDS)
+        def refinement_status():
+            # Resubmitting is a no-op unless the work was dropped, e.g. by
+            # another session that queued it and moved on
+            refiner.submit(view_key, refine, owner=st.session_state.refine_owner)
+            if refiner.done(view_key):
+                st.rerun(scope="app")
+            if intervals is not None:
+                st.info(f"Showing estimates from a stratified sample of {len(dataset.sample.data):,} rows (± is a 95% confidence interval). Exact results will replace them shortly.")
+            else:
+                st.info("Row-level views will appear once the matching rows are ready.")
+
+        refinement_status()
 
-    # Additional Overview Metrics
-    st.subheader("Overview Metrics")
-    col1, col2, col3, col4 = st.columns(4)
+    with span('key_metrics'):
+        # Key metrics
+        col1, col2, col3, col4 = st.columns(4)
     
-    with col1:
-        # Payment Type Distribution
-        payment_total = filtered_df.groupby('Payment')['Price'].sum()
-        top_payment = payment_total.idxmax()
-        st.metric(
-            "Top Payment Method",
-            top_payment,
-            f"${payment_total[top_payment]:,.2f}"
-        )
+        with col1:
+            st.metric(
+                "Total Sales",
+                with_margin(f"${current['Price_sum']:,.2f}", 'Price_sum', lambda m: f"${m:,.0f}"),
+                f"{((current['Price_sum'] / overall['Price_sum'] - 1) * 100):,.1f}%"
+            )
     
-    with col2:
-        # Return Rate
-        return_rate = (filtered_df['Return'] == 'Returned').mean() * 100
-        st.metric(
-            "Return Rate",
-            f"{return_rate:.1f}%",
-            f"{((return_rate - (df['Return'] == 'Returned').mean() * 100)):,.1f}%"
-        )
+        with col2:
+            st.metric(
+                "Total Profit",
+                with_margin(f"${current['Profit_sum']:,.2f}", 'Profit_sum', lambda m: f"${m:,.0f}"),
+                f"{((current['Profit_sum'] / overall['Profit_sum'] - 1) * 100):,.1f}%"
+            )
     
-    with col3:
-        # Average Order Value
-        aov = filtered_df['Price'].mean()
-        st.metric(
-            "Average Order Value",
-            f"${aov:,.2f}",
-            f"{((aov / df['Price'].mean() - 1) * 100):,.1f}%"
-        )
+        with col3:
+            st.metric(
+                "Units Sold",
+                with_margin(f"{int(current['UnitsSold_sum']):,}", 'UnitsSold_sum', lambda m: f"{m:,.0f}"),
+                f"{((current['UnitsSold_sum'] / overall['UnitsSold_sum'] - 1) * 100):,.1f}%"
+            )
     
-    with col4:
-        # Discount Rate
-        discount_rate = (filtered_df['Discount'] == 'Yes').mean() * 100
-        st.metric(
-            "Discount Rate",
-            f"{discount_rate:.1f}%",
-            f"{((discount_rate - (df['Discount'] == 'Yes').mean() * 100)):,.1f}%"
-        )
+        with col4:
+            st.metric(
+                "Average Feedback",
+                with_margin(f"{current['Feedback_mean']:.1f}", 'Feedback_mean', lambda m: f"{m:.2f}"),
+                f"{((current['Feedback_mean'] / overall['Feedback_mean'] - 1) * 100):,.1f}%"
+            )
 
-    # Sales and Profit over time (separate charts)
-    st.subheader("Sales and Profit Analysis")
+    with span('overview_metrics'):
+        # Additional Overview Metrics
+        st.subheader("Overview Metrics")
+        col1, col2, col3, col4 = st.columns(4)
     
-    # Sales over time
-    daily_sales = filtered_df.groupby('Date').agg({
-        'Price': 'sum',
-        'UnitsSold': 'sum'
-    }).reset_index()
+        with col1:
+            # Payment Type Distribution
+            payment_total = cube_rollup('Payment').set_index('Payment')['Price']
+            top_payment = payment_total.idxmax()
+            st.metric(
+                "Top Payment Method",
+                top_payment,
+                f"${payment_total[top_payment]:,.2f}"
+            )
     
-    fig_sales = go.Figure()
-    fig_sales.add_trace(go.Scatter(
-        x=daily_sales['Date'],
-        y=daily_sales['Price'],
-        name='Sales',
-        mode='lines+markers',
-        line=dict(color='#1f77b4', width=2)
-    ))
-    fig_sales.update_layout(
-        title='Daily Sales Over Time',
-        xaxis_title='Date',
-        yaxis_title='Sales Amount ($)',
-        height=400,
-        showlegend=True,
-        hovermode='x unified'
-    )
-    st.plotly_chart(fig_sales, use_container_width=True)
+        with col2:
+            # Return Rate
+            return_rate = cached('share', lambda: share(filtered_cube, 'Return', 'Returned'), 'Return')
+            st.metric(
+                "Return Rate",
+                with_margin(f"{return_rate:.1f}%", ('Return', 'Returned'), lambda m: f"{m:.1f}%"),
+                f"{(return_rate - share(data_cube, 'Return', 'Returned')):,.1f}%"
+            )
     
-    # Profit over time
-    daily_profit = filtered_df.groupby('Date').agg({
-        'Profit': 'sum'
-    }).reset_index()
+        with col3:
+            # Average Order Value
+            aov = current['Price_mean']
+            st.metric(
+                "Average Order Value",
+                with_margin(f"${aov:,.2f}", 'Price_mean', lambda m: f"${m:,.2f}"),
+                f"{((aov / overall['Price_mean'] - 1) * 100):,.1f}%"
+            )
     
-    fig_profit = go.Figure()
-    fig_profit.add_trace(go.Scatter(
-        x=daily_profit['Date'],
-        y=daily_profit['Profit'],
-        name='Profit',
-        mode='lines+markers',
-        line=dict(color='#2ca02c', width=2)
-    ))
-    fig_profit.update_layout(
-        title='Daily Profit Over Time',
-        xaxis_title='Date',
-        yaxis_title='Profit Amount ($)',
-        height=400,
-        showlegend=True,
-        hovermode='x unified'
-    )
-    st.plotly_chart(fig_profit, use_container_width=True)
+        with col4:
+            # Discount Rate
+            discount_rate = cached('share', lambda: share(filtered_cube, 'Discount', 'Yes'), 'Discount')
+            st.metric(
+                "Discount Rate",
+                with_margin(f"{discount_rate:.1f}%", ('Discount', 'Yes'), lambda m: f"{m:.1f}%"),
+                f"{(discount_rate - share(data_cube, 'Discount', 'Yes')):,.1f}%"
+            )
 
-    # Sales and Profit Summary
-    col1, col2 = st.columns(2)
+    with span('sales_profit_charts'):
+        # Sales and Profit over time (separate charts)
+        st.subheader("Sales and Profit Analysis")
     
-    with col1:
-        st.metric(
-            "Total Sales",
-            f"${daily_sales['Price'].sum():,.2f}",
-            f"Daily Avg: ${daily_sales['Price'].mean():,.2f}"
+        # Sales over time
+        daily_totals = cube_rollup('Date', ('Price', 'UnitsSold', 'Profit'))
+        daily_sales = daily_totals[['Date', 'Price', 'UnitsSold']]
+    
+        sales_points = chart_points('chart_points', daily_sales, ('Price',))
+        fig_sales = go.Figure()
+        fig_sales.add_trace(go.Scatter(
+            x=sales_points['Date'],
+            y=sales_points['Price'],
+            name='Sales',
+            mode='lines+markers',
+            line=dict(color='#1f77b4', width=2)
+        ))
+        fig_sales.update_layout(
+            title='Daily Sales Over Time',
+            xaxis_title='Date',
+            yaxis_title='Sales Amount ($)',
+            height=400,
+            showlegend=True,
+            hovermode='x unified'
         )
+        st.plotly_chart(fig_sales, use_container_width=True)
+        points_note(sales_points, daily_sales)
     
-    with col2:
-        st.metric(
-            "Total Profit",
-            f"${daily_profit['Profit'].sum():,.2f}",
-            f"Daily Avg: ${daily_profit['Profit'].mean():,.2f}"
+        # Profit over time
+        daily_profit = daily_totals[['Date', 'Profit']]
+    
+        profit_points = chart_points('chart_points', daily_profit, ('Profit',))
+        fig_profit = go.Figure()
+        fig_profit.add_trace(go.Scatter(
+            x=profit_points['Date'],
+            y=profit_points['Profit'],
+            name='Profit',
+            mode='lines+markers',
+            line=dict(color='#2ca02c', width=2)
+        ))
+        fig_profit.update_layout(
+            title='Daily Profit Over Time',
+            xaxis_title='Date',
+            yaxis_title='Profit Amount ($)',
+            height=400,
+            showlegend=True,
+            hovermode='x unified'
         )
+        st.plotly_chart(fig_profit, use_container_width=True)
+        points_note(profit_points, daily_profit)
 
-    # Distribution Charts
-    st.subheader("Distribution Analysis")
-    col1, col2 = st.columns(2)
+        # Sales and Profit Summary
+        col1, col2 = st.columns(2)
     
-    with col1:
-        # Sales by city
-        fig_city = px.bar(
-            filtered_df.groupby('City')['Price'].sum().reset_index(),
-            x='City',
-            y='Price',
-            title='Sales by City'
-        )
-        st.plotly_chart(fig_city, use_container_width=True)
+        with col1:
+            st.metric(
+                "Total Sales",
+                f"${daily_sales['Price'].sum():,.2f}",
+                f"Daily Avg: ${daily_sales['Price'].mean():,.2f}"
+            )
+    
+        with col2:
+            st.metric(
+                "Total Profit",
+                f"${daily_profit['Profit'].sum():,.2f}",
+                f"Daily Avg: ${daily_profit['Profit'].mean():,.2f}"
+            )
+
+    with span('distribution_charts'):
+        # Distribution Charts
+        st.subheader("Distribution Analysis")
+        col1, col2 = st.columns(2)
+    
+        with col1:
+            # Sales by city
+            fig_city = px.bar(
+                cube_rollup('City'),
+                x='City',
+                y='Price',
+                title='Sales by City'
+            )
+            st.plotly_chart(fig_city, use_container_width=True)
         
-        # Sales by gender
-        fig_gender = px.pie(
-            filtered_df,
-            names='Gender',
-            values='Price',
-            title='Sales by Gender'
-        )
-        st.plotly_chart(fig_gender, use_container_width=True)
+            # Sales by gender
+            fig_gender = px.pie(
+                cube_rollup('Gender'),
+                names='Gender',
+                values='Price',
+                title='Sales by Gender'
+            )
+            st.plotly_chart(fig_gender, use_container_width=True)
 
-    with col2:
-        # Sales by item type
-        fig_item = px.bar(
-            filtered_df.groupby('ItemType')['Price'].sum().reset_index(),
-            x='ItemType',
-            y='Price',
-            title='Sales by Item Type'
-        )
-        st.plotly_chart(fig_item, use_container_width=True)
+        with col2:
+            # Sales by item type
+            fig_item = px.bar(
+                cube_rollup('ItemType'),
+                x='ItemType',
+                y='Price',
+                title='Sales by Item Type'
+            )
+            st.plotly_chart(fig_item, use_container_width=True)
         
-        # Payment method distribution
-        fig_payment = px.pie(
-            filtered_df,
-            names='Payment',
-            values='Price',
-            title='Sales by Payment Method'
-        )
-        st.plotly_chart(fig_payment, use_container_width=True)
+            # Payment method distribution
+            fig_payment = px.pie(
+                cube_rollup('Payment'),
+                names='Payment',
+                values='Price',
+                title='Sales by Payment Method'
+            )
+            st.plotly_chart(fig_payment, use_container_width=True)
 
-    # Additional insights
-    st.subheader("Additional Insights")
-    col1, col2 = st.columns(2)
+    with span('insight_charts'):
+        # Additional insights
+        st.subheader("Additional Insights")
+        col1, col2 = st.columns(2)
     
-    with col1:
-        # Return rate analysis
-        returns_data = filtered_df.groupby('Return')['Price'].sum().reset_index()
-        fig_returns = px.pie(
-            returns_data,
-            names='Return',
-            values='Price',
-            title='Sales by Return Status'
-        )
-        st.plotly_chart(fig_returns, use_container_width=True)
+        with col1:
+            # Return rate analysis
+            returns_data = cube_rollup('Return')
+            fig_returns = px.pie(
+                returns_data,
+                names='Return',
+                values='Price',
+                title='Sales by Return Status'
+            )
+            st.plotly_chart(fig_returns, use_container_width=True)
 
-    with col2:
-        # Discount analysis
-        discount_data = filtered_df.groupby('Discount')['Price'].sum().reset_index()
-        fig_discount = px.pie(
-            discount_data,
-            names='Discount',
-            values='Price',
-            title='Sales by Discount Status'
-        )
-        st.plotly_chart(fig_discount, use_container_width=True)
+        with col2:
+            # Discount analysis
+            discount_data = cube_rollup('Discount')
+            fig_discount = px.pie(
+                discount_data,
+                names='Discount',
+                values='Price',
+                title='Sales by Discount Status'
+            )
+            st.plotly_chart(fig_discount, use_container_width=True)
 
-    # Create tabs for different views
-    tab1, tab2 = st.tabs(["Advanced Analytics", "Comparison View"])
-    
-    with tab1:
-        st.subheader("Advanced Analytics")
+    # Each analysis section is a fragment that only runs while its tab is
+    # open. Its own widgets rerun just that section, not the whole page.
+    @st.fragment
+    @timings.timed('sales_analysis')
+    def sales_analysis():
+        st.write("### 📈 Sales Analysis")
         
-        # Create tabs for different types of analysis
-        analysis_tab1, analysis_tab2, analysis_tab3 = st.tabs(["Sales Analysis", "Customer Analysis", "Product Analysis"])
+        # Sales Forecasting
+        st.write("#### Sales Forecasting")
+        col1, col2 = st.columns(2)
         
-        with analysis_tab1:
-            st.write("### 📈 Sales Analysis")
-            
-            # Sales Forecasting
-            st.write("#### Sales Forecasting")
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                days_to_forecast = st.slider("Days to Forecast", 7, 90, 30)
-                forecast_metric = st.selectbox(
-                    "Select Metric to Forecast",
-                    ['Price', 'UnitsSold', 'Profit']
-                )
-            
-            # Prepare data for forecasting
-            daily_sales = filtered_df.groupby('Date')[forecast_metric].sum().reset_index()
-            future_dates, predictions = forecast_sales(daily_sales, days_to_forecast, forecast_metric)
-            
-            # Create forecast plot
-            fig_forecast = go.Figure()
-            fig_forecast.add_trace(go.Scatter(
-                x=daily_sales['Date'],
-                y=daily_sales[forecast_metric],
-                name='Historical Data',
-                mode='lines+markers'
-            ))
-            fig_forecast.add_trace(go.Scatter(
-                x=future_dates,
-                y=predictions,
-                name='Forecast',
-                mode='lines',
-                line=dict(dash='dash')
-            ))
-            fig_forecast.update_layout(
-                title=f'{forecast_metric} Forecast',
-                xaxis_title='Date',
-                yaxis_title=forecast_metric
+        with col1:
+            days_to_forecast = st.slider("Days to Forecast", 7, 90, 30)
+            forecast_metric = st.selectbox(
+                "Select Metric to Forecast",
+                ['Price', 'UnitsSold', 'Profit']
             )
-            st.plotly_chart(fig_forecast, use_container_width=True)
+        
+        # Prepare data for forecasting
+        with span('forecast'):
+            daily_sales = cube_rollup('Date', (forecast_metric,))
+            future_dates, predictions = forecast_series(daily_sales, days_to_forecast, forecast_metric)
+        
+        # Create forecast plot; the fit above used every day
+        history_points = chart_points('chart_points', daily_sales, (forecast_metric,))
+        fig_forecast = go.Figure()
+        fig_forecast.add_trace(go.Scatter(
+            x=history_points['Date'],
+            y=history_points[forecast_metric],
+            name='Historical Data',
+            mode='lines+markers'
+        ))
+        fig_forecast.add_trace(go.Scatter(
+            x=future_dates,
+            y=predictions,
+            name='Forecast',
+            mode='lines',
+            line=dict(dash='dash')
+        ))
+        fig_forecast.update_layout(
+            title=f'{forecast_metric} Forecast',
+            xaxis_title='Date',
+            yaxis_title=forecast_metric
+        )
+        st.plotly_chart(fig_forecast, use_container_width=True)
+        points_note(history_points, daily_sales)
 
-            # Sales Trends
-            st.write("#### Sales Trends")
-            trend_metric = st.selectbox(
-                "Select Metric for Trend Analysis",
-                ['Price', 'UnitsSold', 'Profit']
+        # Forecasts for every Item Type, City and Item Type × City
+        # series, fitted together in one vectorized solve
+        st.write("#### Replenishment Forecasts")
+        if st.toggle("Forecast every Item Type and City", key="batch_forecast"):
+            with span('batch_forecast'):
+                replenishment = cached(
+                    'batch_forecast',
+                    lambda: batch_forecast(filtered_cube, days_to_forecast, forecast_metric),
+                    days_to_forecast, forecast_metric
+                )
+            st.dataframe(replenishment, use_container_width=True, hide_index=True)
+            st.download_button(
+                label="Download Forecasts as CSV",
+                data=replenishment.to_csv(index=False),
+                file_name=f"{forecast_metric.lower()}_forecasts.csv",
+                mime="text/csv"
             )
-            
-            # Calculate moving averages
-            daily_data = filtered_df.groupby('Date')[trend_metric].sum().reset_index()
-            daily_data['7_day_MA'] = daily_data[trend_metric].rolling(window=7).mean()
-            daily_data['30_day_MA'] = daily_data[trend_metric].rolling(window=30).mean()
-            
-            fig_trend = px.line(
-                daily_data,
-                x='Date',
-                y=[trend_metric, '7_day_MA', '30_day_MA'],
-                title=f'{trend_metric} Trends with Moving Averages'
+
+        # Sales Trends
+        st.write("#### Sales Trends")
+        trend_metric = st.selectbox(
+            "Select Metric for Trend Analysis",
+            ['Price', 'UnitsSold', 'Profit']
+        )
+        
+        # Calculate moving averages on a new frame; the daily rollup is a
+        # shared cache entry and must not be changed
+        def moving_averages():
+            daily_data = cube_rollup('Date', (trend_metric,))
+            return daily_data.assign(**{
+                '7_day_MA': daily_data[trend_metric].rolling(window=7).mean(),
+                '30_day_MA': daily_data[trend_metric].rolling(window=30).mean(),
+            })
+
+        daily_data = cached('moving_averages', moving_averages, trend_metric)
+        # Averages are computed over every day and ride along with the
+        # points kept for the raw metric
+        trend_points = chart_points('chart_points', daily_data, (trend_metric,), 'moving_averages')
+        
+        fig_trend = px.line(
+            trend_points,
+            x='Date',
+            y=[trend_metric, '7_day_MA', '30_day_MA'],
+            title=f'{trend_metric} Trends with Moving Averages'
+        )
+        st.plotly_chart(fig_trend, use_container_width=True)
+        points_note(trend_points, daily_data)
+
+        # Sales Distribution
+        st.write("#### Sales Distribution")
+        if row_positions is not None:
+            # Bin edges and each row's bin are fixed per dataset, so a filter
+            # change only counts the selected rows per bin and the figure
+            # carries one bar per bin instead of every row
+            edges, codes = result_cache.get_or_compute(
+                (dataset_key, 'histogram_bins', trend_metric),
+                lambda: histogram_bins(df[trend_metric])
             )
-            st.plotly_chart(fig_trend, use_container_width=True)
-
-            # Sales Distribution
-            st.write("#### Sales Distribution")
-            fig_dist = px.histogram(
-                filtered_df,
-                x=trend_metric,
-                nbins=50,
-                title=f'Distribution of {trend_metric}'
+            with span('histogram'):
+                histogram = cached('histogram', lambda: binned_histogram(codes, edges, row_positions), trend_metric)
+            fig_dist = go.Figure(go.Bar(
+                x=(histogram['Start'] + histogram['End']) / 2,
+                y=histogram['Count'],
+                width=histogram['End'] - histogram['Start'],
+                customdata=histogram[['Start', 'End']],
+                hovertemplate='%{customdata[0]:,.2f} – %{customdata[1]:,.2f}<br>Count: %{y:,}<extra></extra>'
+            ))
+            fig_dist.update_layout(
+                title=f'Distribution of {trend_metric}',
+                xaxis_title=trend_metric,
+                yaxis_title='count',
+                bargap=0
             )
             st.plotly_chart(fig_dist, use_container_width=True)
+        else:
+            st.info("The distribution of individual sales needs row-level data.")
 
-        with analysis_tab2:
-            st.write("### 👥 Customer Analysis")
-            
-            # Customer Segmentation
-            st.write("#### Customer Segmentation")
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                # Age groups
-                filtered_df['AgeGroup'] = pd.cut(
-                    filtered_df['Age'],
-                    bins=[0, 25, 35, 45, 55, 100],
-                    labels=['0-25', '26-35', '36-45', '46-55', '55+']
-                )
-                age_group_sales = filtered_df.groupby('AgeGroup')['Price'].sum()
-                fig_age_group = px.bar(
-                    age_group_sales.reset_index(),
-                    x='AgeGroup',
-                    y='Price',
-                    title='Sales by Age Group'
-                )
-                st.plotly_chart(fig_age_group, use_container_width=True)
-            
-            with col2:
-                # Payment method preference by age group
-                payment_by_age = filtered_df.groupby(['AgeGroup', 'Payment'])['Price'].sum().reset_index()
-                fig_payment_age = px.bar(
-                    payment_by_age,
-                    x='AgeGroup',
-                    y='Price',
-                    color='Payment',
-                    title='Payment Method Preference by Age Group'
-                )
-                st.plotly_chart(fig_payment_age, use_container_width=True)
-
-            # Customer Behavior Analysis
-            st.write("#### Customer Behavior Analysis")
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                # Return rate by age group
-                returns_by_age = filtered_df.groupby(['AgeGroup', 'Return'])['Price'].count().reset_index()
-                fig_returns_age = px.bar(
-                    returns_by_age,
-                    x='AgeGroup',
-                    y='Price',
-                    color='Return',
-                    title='Return Rate by Age Group'
-                )
-                st.plotly_chart(fig_returns_age, use_container_width=True)
-            
-            with col2:
-                # Feedback distribution by age group
-                feedback_by_age = filtered_df.groupby('AgeGroup')['Feedback'].mean().reset_index()
-                fig_feedback_age = px.bar(
-                    feedback_by_age,
-                    x='AgeGroup',
-                    y='Feedback',
-                    title='Average Feedback by Age Group'
-                )
-                st.plotly_chart(fig_feedback_age, use_container_width=True)
+    @st.fragment
+    @timings.timed('customer_analysis')
+    def customer_analysis():
+        st.write("### 👥 Customer Analysis")
+        
+        # Customer Segmentation
+        st.write("#### Customer Segmentation")
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            # Age groups
+            age_group_sales = cube_rollup('AgeGroup')
+            fig_age_group = px.bar(
+                age_group_sales,
+                x='AgeGroup',
+                y='Price',
+                title='Sales by Age Group'
+            )
+            st.plotly_chart(fig_age_group, use_container_width=True)
+        
+        with col2:
+            # Payment method preference by age group
+            payment_by_age = cube_rollup(['AgeGroup', 'Payment'])
+            fig_payment_age = px.bar(
+                payment_by_age,
+                x='AgeGroup',
+                y='Price',
+                color='Payment',
+                title='Payment Method Preference by Age Group'
+            )
+            st.plotly_chart(fig_payment_age, use_container_width=True)
 
-        with analysis_tab3:
-            st.write("### 📦 Product Analysis")
-            
-            # Product Performance
-            st.write("#### Product Performance")
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                # Sales by item type
-                item_sales = filtered_df.groupby('ItemType')['Price'].sum().sort_values(ascending=False)
-                fig_item_sales = px.bar(
-                    item_sales.reset_index(),
-                    x='ItemType',
-                    y='Price',
-                    title='Sales by Item Type'
-                )
-                st.plotly_chart(fig_item_sales, use_container_width=True)
-            
-            with col2:
-                # Profit margin by item type
-                item_profit = filtered_df.groupby('ItemType')['Profit'].sum().sort_values(ascending=False)
-                fig_item_profit = px.bar(
-                    item_profit.reset_index(),
-                    x='ItemType',
-                    y='Profit',
-                    title='Profit by Item Type'
-                )
-                st.plotly_chart(fig_item_profit, use_container_width=True)
-
-            # Product Metrics
-            st.write("#### Product Metrics")
-            metrics_data = filtered_df.groupby('ItemType').agg({
-                'Price': ['sum', 'mean'],
-                'UnitsSold': ['sum', 'mean'],
-                'Profit': ['sum', 'mean'],
-                'Feedback': 'mean'
-            }).round(2)
-            
-            metrics_data.columns = ['_'.join(col).strip() for col in metrics_data.columns.values]
-            st.dataframe(metrics_data.style.format("{:.2f}"))
-
-            # Product Trends
-            st.write("#### Product Trends")
-            trend_item = st.selectbox(
-                "Select Item Type for Trend Analysis",
-                filtered_df['ItemType'].unique()
+        # Customer Behavior Analysis
+        st.write("#### Customer Behavior Analysis")
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            # Return rate by age group
+            returns_by_age = cube_rollup(['AgeGroup', 'Return'], ('Price',), 'count')
+            fig_returns_age = px.bar(
+                returns_by_age,
+                x='AgeGroup',
+                y='Price',
+                color='Return',
+                title='Return Rate by Age Group'
             )
-            
-            item_trend = filtered_df[filtered_df['ItemType'] == trend_item].groupby('Date')['Price'].sum().reset_index()
-            fig_item_trend = px.line(
-                item_trend,
-                x='Date',
+            st.plotly_chart(fig_returns_age, use_container_width=True)
+        
+        with col2:
+            # Feedback distribution by age group
+            feedback_by_age = cube_rollup('AgeGroup', ('Feedback',), 'mean')
+            fig_feedback_age = px.bar(
+                feedback_by_age,
+                x='AgeGroup',
+                y='Feedback',
+                title='Average Feedback by Age Group'
+            )
+            st.plotly_chart(fig_feedback_age, use_container_width=True)
+
+    @st.fragment
+    @timings.timed('product_analysis')
+    def product_analysis():
+        st.write("### 📦 Product Analysis")
+        
+        # Product Performance
+        st.write("#### Product Performance")
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            # Sales by item type
+            item_sales = cube_rollup('ItemType').sort_values('Price', ascending=False)
+            fig_item_sales = px.bar(
+                item_sales,
+                x='ItemType',
                 y='Price',
-                title=f'Sales Trend for {trend_item}'
+                title='Sales by Item Type'
+            )
+            st.plotly_chart(fig_item_sales, use_container_width=True)
+        
+        with col2:
+            # Profit margin by item type
+            item_profit = cube_rollup('ItemType', ('Profit',)).sort_values('Profit', ascending=False)
+            fig_item_profit = px.bar(
+                item_profit,
+                x='ItemType',
+                y='Profit',
+                title='Profit by Item Type'
             )
-            st.plotly_chart(fig_item_trend, use_container_width=True)
+            st.plotly_chart(fig_item_profit, use_container_width=True)
 
-    with tab2:
+        # Product Metrics
+        st.write("#### Product Metrics")
+        item_sums = cube_rollup('ItemType', ('Price', 'UnitsSold', 'Profit'), 'sum').set_index('ItemType')
+        item_means = cube_rollup('ItemType', ('Price', 'UnitsSold', 'Profit', 'Feedback'), 'mean').set_index('ItemType')
+        metrics_data = pd.DataFrame({
+            'Price_sum': item_sums['Price'],
+            'Price_mean': item_means['Price'],
+            'UnitsSold_sum': item_sums['UnitsSold'],
+            'UnitsSold_mean': item_means['UnitsSold'],
+            'Profit_sum': item_sums['Profit'],
+            'Profit_mean': item_means['Profit'],
+            'Feedback_mean': item_means['Feedback']
+        }).round(2)
+        st.dataframe(metrics_data.style.format("{:.2f}"))
+
+        # Product Trends
+        st.write("#### Product Trends")
+        trend_item = st.selectbox(
+            "Select Item Type for Trend Analysis",
+            filtered_cube['ItemType'].unique()
+        )
+        
+        item_trend = cached(
+            'item_trend',
+            lambda: rollup(filter_cube(filtered_cube, selections={'ItemType': [trend_item]}), 'Date'),
+            trend_item
+        )
+        item_points = chart_points('chart_points', item_trend, ('Price',), 'item_trend', trend_item)
+        fig_item_trend = px.line(
+            item_points,
+            x='Date',
+            y='Price',
+            title=f'Sales Trend for {trend_item}'
+        )
+        st.plotly_chart(fig_item_trend, use_container_width=True)
+        points_note(item_points, item_trend)
+
+    @st.fragment
+    @timings.timed('comparison_view')
+    def comparison_view():
         st.subheader("Comparison View")
         
         # Comparison settings
@@ -1033,26 +1271,51 @@ if st.session_state.data is not None:
                 default=['Gender', 'City']
             )
             
-            # Select aggregation method
+            # Select aggregation method; the median needs row-level data
             aggregation_method = st.selectbox(
                 "Select Aggregation Method",
-                ['sum', 'mean', 'median', 'count']
+                ['sum', 'mean', 'median', 'count'] if df is not None else ['sum', 'mean', 'count']
             )
 
+        # Sums, means and counts come from the cube; medians and the
+        # row-level charts work on the filtered rows, sliced to the columns
+        # the comparison uses
+        def comparison_rows():
+            dimensions = [d for d in comparison_dimensions if d != 'AgeGroup']
+            rows = filtered_rows(dict.fromkeys(['Date', 'Age'] + comparison_metrics + dimensions))
+            return rows.assign(AgeGroup=age_groups(rows['Age']))
+
+        if row_positions is not None and comparison_type in ('Scatter Plot', 'Heat Map'):
+            comparison_df = comparison_rows()
+
+        # Group the comparison metrics by a dimension
+        def compare_by(dimension):
+            if aggregation_method == 'median':
+                return cached(
+                    'compare',
+                    lambda: comparison_rows().groupby(dimension, observed=True)[comparison_metrics].agg(aggregation_method).reset_index(),
+                    dimension, tuple(comparison_metrics), aggregation_method
+                )
+            return cube_rollup(dimension, comparison_metrics, aggregation_method)
+
         # Create comparison visualizations
-        if comparison_metrics and comparison_dimensions:
+        if aggregation_method == 'median' and row_positions is None:
+            st.info("Medians are shown once exact results are ready.")
+        elif comparison_metrics and comparison_dimensions:
             st.write("### 📊 Comparison Analysis")
             
             # Time-based comparison
             st.write("#### Time Series Comparison")
-            time_data = filtered_df.groupby('Date')[comparison_metrics].agg(aggregation_method).reset_index()
+            time_data = compare_by('Date')
+            time_points = chart_points('chart_points', time_data, comparison_metrics, 'compare', aggregation_method)
             fig_time = px.line(
-                time_data,
+                time_points,
                 x='Date',
                 y=comparison_metrics,
                 title=f'Time Series Comparison of {", ".join(comparison_metrics)}'
             )
             st.plotly_chart(fig_time, use_container_width=True)
+            points_note(time_points, time_data)
 
             # Dimension-based comparison
             st.write("#### Dimension Comparison")
@@ -1060,7 +1323,7 @@ if st.session_state.data is not None:
             if comparison_type == 'Bar Chart':
                 # Create grouped bar chart
                 for dimension in comparison_dimensions:
-                    dim_data = filtered_df.groupby(dimension)[comparison_metrics].agg(aggregation_method).reset_index()
+                    dim_data = compare_by(dimension)
                     fig_dim = px.bar(
                         dim_data,
                         x=dimension,
@@ -1073,7 +1336,7 @@ if st.session_state.data is not None:
             elif comparison_type == 'Line Chart':
                 # Create line chart
                 for dimension in comparison_dimensions:
-                    dim_data = filtered_df.groupby(dimension)[comparison_metrics].agg(aggregation_method).reset_index()
+                    dim_data = compare_by(dimension)
                     fig_dim = px.line(
                         dim_data,
                         x=dimension,
@@ -1083,10 +1346,13 @@ if st.session_state.data is not None:
                     )
                     st.plotly_chart(fig_dim, use_container_width=True)
             
+            elif row_positions is None:
+                st.info(f"{comparison_type} comparisons need row-level data.")
+
             elif comparison_type == 'Scatter Plot':
                 # Create scatter plot matrix
                 fig_scatter = px.scatter_matrix(
-                    filtered_df,
+                    comparison_df,
                     dimensions=comparison_metrics,
                     color=comparison_dimensions[0] if comparison_dimensions else None,
                     title='Scatter Plot Matrix'
@@ -1096,11 +1362,12 @@ if st.session_state.data is not None:
             elif comparison_type == 'Heat Map':
                 # Create heat map
                 for dimension in comparison_dimensions:
-                    pivot_data = filtered_df.pivot_table(
+                    pivot_data = comparison_df.pivot_table(
                         values=comparison_metrics[0],
                         index=dimension,
                         columns=comparison_metrics[1] if len(comparison_metrics) > 1 else None,
-                        aggfunc=aggregation_method
+                        aggfunc=aggregation_method,
+                        observed=True
                     )
                     fig_heat = px.imshow(
                         pivot_data,
@@ -1110,9 +1377,10 @@ if st.session_state.data is not None:
                     st.plotly_chart(fig_heat, use_container_width=True)
 
             # Statistical Summary
-            st.write("### 📈 Statistical Summary")
-            summary_data = filtered_df[comparison_metrics].describe()
-            st.dataframe(summary_data.style.format("{:.2f}"))
+            if row_positions is not None:
+                st.write("### 📈 Statistical Summary")
+                summary_data = cached('describe', lambda: filtered_rows(comparison_metrics).describe(), tuple(comparison_metrics))
+                st.dataframe(summary_data.style.format("{:.2f}"))
 
             # Performance Metrics
             st.write("### 🎯 Performance Metrics")
@@ -1122,45 +1390,158 @@ if st.session_state.data is not None:
                 for metric in comparison_metrics:
                     st.metric(
                         f"Total {metric}",
-                        f"{filtered_df[metric].sum():,.2f}",
-                        f"{((filtered_df[metric].sum() / df[metric].sum() - 1) * 100):,.1f}%"
+                        f"{current[f'{metric}_sum']:,.2f}",
+                        f"{((current[f'{metric}_sum'] / overall[f'{metric}_sum'] - 1) * 100):,.1f}%"
                     )
             
             with col2:
                 for metric in comparison_metrics:
                     st.metric(
                         f"Average {metric}",
-                        f"{filtered_df[metric].mean():,.2f}",
-                        f"{((filtered_df[metric].mean() / df[metric].mean() - 1) * 100):,.1f}%"
+                        f"{current[f'{metric}_mean']:,.2f}",
+                        f"{((current[f'{metric}_mean'] / overall[f'{metric}_mean'] - 1) * 100):,.1f}%"
                     )
             
             with col3:
-                for metric in comparison_metrics:
-                    st.metric(
-                        f"Median {metric}",
-                        f"{filtered_df[metric].median():,.2f}",
-                        f"{((filtered_df[metric].median() / df[metric].median() - 1) * 100):,.1f}%"
-                    )
+                if row_positions is not None:
+                    for metric in comparison_metrics:
+                        median = cached('median', lambda: filtered_rows([metric])[metric].median(), metric)
+                        overall_median = result_cache.get_or_compute(
+                            (dataset_key, 'median', metric), lambda: df[metric].median()
+                        )
+                        st.metric(
+                            f"Median {metric}",
+                            f"{median:,.2f}",
+                            f"{((median / overall_median - 1) * 100):,.1f}%"
+                        )
 
         else:
             st.info("Please select at least one metric and dimension to view comparisons.")
 
-    # Data table with sorting and filtering
-    st.subheader("Detailed Data")
-    st.dataframe(
-        filtered_df.style.format({
-            'Price': '${:,.2f}',
-            'Profit': '${:,.2f}',
-            'Feedback': '{:.1f}'
-        }),
-        use_container_width=True
-    )
+    # Create tabs for different views
+    tab1, tab2 = st.tabs(["Advanced Analytics", "Comparison View"], key="view_tab", on_change="rerun")
+    
+    with tab1:
+        if tab1.open:
+            st.subheader("Advanced Analytics")
+            
+            # Create tabs for different types of analysis
+            analysis_tab1, analysis_tab2, analysis_tab3 = st.tabs(
+                ["Sales Analysis", "Customer Analysis", "Product Analysis"],
+                key="analysis_tab",
+                on_change="rerun"
+            )
+            
+            with analysis_tab1:
+                if analysis_tab1.open:
+                    sales_analysis()
 
-    # Download button for filtered data
-    csv = filtered_df.to_csv(index=False)
-    st.download_button(
-        label="Download Filtered Data as CSV",
-        data=csv,
-        file_name="filtered_sales_data.csv",
-        mime="text/csv"
-    )
+            with analysis_tab2:
+                if analysis_tab2.open:
+                    customer_analysis()
+
+            with analysis_tab3:
+                if analysis_tab3.open:
+                    product_analysis()
+
+    with tab2:
+        if tab2.open:
+            comparison_view()
+
+    # Data table, one page at a time. Rows are ordered through a sort order
+    # computed once per dataset and column, and only the visible page is
+    # sliced and formatted. Paging reruns just this section.
+    @st.fragment
+    @timings.timed('detailed_data')
+    def detailed_data():
+        st.subheader("Detailed Data")
+        col1, col2, col3 = st.columns(3)
+
+        with col1:
+            sort_column = st.selectbox("Sort by", list(df.columns), index=list(df.columns).index('Date'))
+        with col2:
+            sort_direction = st.selectbox("Order", ['Ascending', 'Descending'])
+        with col3:
+            page_size = st.selectbox("Rows per page", PAGE_SIZES, index=1)
+
+        ascending = sort_direction == 'Ascending'
+        order = result_cache.get_or_compute(
+            (dataset_key, 'sort_order', sort_column, ascending),
+            lambda: sort_order(df[sort_column], ascending)
+        )
+        positions = cached('table_order', lambda: sorted_positions(order, row_positions), sort_column, ascending)
+
+        n_pages = max(1, -(-len(positions) // page_size))
+        page = st.number_input(f"Page (of {n_pages:,})", min_value=1, max_value=n_pages, value=1)
+        page_rows = page_positions(positions, page, page_size)
+
+        first_row = (page - 1) * page_size
+        st.caption(f"Rows {min(first_row + 1, len(positions)):,}–{first_row + len(page_rows):,} of {len(positions):,}")
+        with span('table_render'):
+            st.dataframe(
+                df.iloc[page_rows].style.format({
+                    'Price': '${:,.2f}',
+                    'Profit': '${:,.2f}',
+                    'Feedback': '{:.1f}'
+                }),
+                use_container_width=True
+            )
+
+    if row_positions is not None:
+        detailed_data()
+
+        # Download button for filtered data. The file is written in chunks
+        # only when the button is clicked, on a thread of its own.
+        export_format = st.selectbox("Download format", list(EXPORT_FORMATS))
+        extension, mime = EXPORT_FORMATS[export_format]
+
+        @timings.timed('export')
+        def export_file():
+            return export_rows(df, row_positions, export_format)
+
+        st.download_button(
+            label=f"Download Filtered Data as {export_format}",
+            data=export_file,
+            file_name=f"filtered_sales_data.{extension}",
+            mime=mime
+        )
+
+    # Shared dataset statistics
+    with st.sidebar.expander("Shared Datasets"):
+        dataset_stats = datasets.stats()
+        st.write(f"Datasets: {dataset_stats['datasets']:,} ({dataset_stats['open']:,} open in {dataset_stats['sessions']:,} sessions)")
+        st.write(f"Memory: {dataset_stats['bytes'] / 1024 ** 2:,.1f} MB | Evictions: {dataset_stats['evictions']:,}")
+
+    # Result cache statistics
+    with st.sidebar.expander("Result Cache"):
+        cache_stats = result_cache.stats()
+        st.write(f"Hits: {cache_stats['hits']:,} | Misses: {cache_stats['misses']:,} ({cache_stats['hit_rate']:.0%} hit rate)")
+        st.write(f"Entries: {cache_stats['entries']:,} | Evictions: {cache_stats['evictions']:,}")
+        st.write(f"Memory: {cache_stats['bytes'] / 1024 ** 2:,.1f} MB of {cache_stats['max_bytes'] / 1024 ** 2:,.0f} MB")
+
+    # Section timings over recent reruns, for finding slow sections
+    with st.sidebar.expander("Performance"):
+        # Tracing is process-wide, so it only changes when the toggle does
+        st.toggle(
+            "Track memory allocations",
+            value=timings.tracking_memory,
+            key="track_memory",
+            on_change=lambda: timings.track_memory(st.session_state.track_memory)
+        )
+        if timings.tracking_memory:
+            st.caption("Peaks are only measured for reruns that did not overlap another session's.")
+        timing_stats = timings.stats()
+        if timing_stats:
+            timing_table = pd.DataFrame(timing_stats)
+            timing_table['peak_alloc_MB'] = timing_table.pop('peak_alloc_bytes').astype('float64') / 1024 ** 2
+            st.dataframe(
+                timing_table.style.format({
+                    'last_s': '{:.3f}',
+                    'p50_s': '{:.3f}',
+                    'p95_s': '{:.3f}',
+                    'peak_alloc_MB': '{:.1f}'
+                }, na_rep='–'),
+                hide_index=True
+            )
+        if st.button("Reset timings"):
+            timings.clear()
@@ -0,0 +1,228 @@
+import logging
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from cube import build_cube, filter_cube, age_group_filter, AGE_BINS, AGE_LABELS, CUBE_DIMENSIONS, CUBE_MEASURES
+from filter_index import filter_mask, date_window
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+# Query backend used by the dashboard: 'pandas' (default) or 'duckdb'
+QUERY_BACKEND = os.environ.get('REVIFY_QUERY_BACKEND', 'pandas')
+
+logger = logging.getLogger('revify.backends')
+
+
+# A query backend answers the dashboard's filters. Filters are a date
+# range, category selections ({column: values}) and numeric ranges
+# ({column: (low, high)} or None when not filtered). Backends return the
+# positions of the matching rows for the row-level views and the
+# aggregate cube of the matching rows for everything else.
+
+
+# In-memory backend: the bitmap filter index finds rows and the shared
+# aggregate cube answers every filter it can
+class PandasBackend:
+    name = 'pandas'
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+        self._ranges = {}
+
+    # (min, max) of a numeric column, or None when the rows are not loaded.
+    # Range columns read their ends off the filter index's sort order
+    # (missing values sort last); the result is kept per column.
+    def value_range(self, col):
+        df = self.dataset.data
+        if df is None:
+            return None
+        if col not in self._ranges:
+            entry = self.dataset.filter_index['sorted'].get(col)
+            if entry is None:
+                self._ranges[col] = (df[col].min(), df[col].max())
+            else:
+                valid = int(np.searchsorted(entry['values'], np.inf, side='right'))
+                ends = entry['raw'][entry['order'][[0, valid - 1]]] if valid else (np.nan, np.nan)
+                self._ranges[col] = (ends[0], ends[1])
+        return self._ranges[col]
+
+    # Positions of the matching rows, or None without row-level data. Data
+    # is stored sorted by date, so the date range is a binary search that
+    # narrows every other filter to the rows inside the window.
+    def row_positions(self, date_range, selections, ranges):
+        df = self.dataset.data
+        if df is None:
+            return None
+        index = self.dataset.filter_index
+        window = date_window(index, date_range)
+        mask = filter_mask(index, selections=selections, ranges=ranges, window=window)
+        if window is not None:
+            return window[0] + np.flatnonzero(mask)
+        mask &= (
+            (df['Date'] >= pd.Timestamp(date_range[0])) &
+            (df['Date'] < pd.Timestamp(date_range[1]) + pd.Timedelta(days=1))
+        ).to_numpy()
+        return np.flatnonzero(mask)
+
+    # Whether the shared aggregate cube answers the filters without
+    # scanning rows
+    def answers_from_cube(self, selections, ranges):
+        return self._cube_selections(selections, ranges) is not None
+
+    # Aggregate cube of the matching rows. The cube holds no prices and
+    # only age groups, so a narrowed price range or an age range that
+    # splits a group is aggregated from the matching rows instead.
+    def filtered_cube(self, date_range, selections, ranges, row_positions=None):
+        cube_selections = self._cube_selections(selections, ranges)
+        if cube_selections is None:
+            return build_cube(self.dataset.data.iloc[row_positions])
+        return filter_cube(self.dataset.cube, date_range, cube_selections)
+
+    # Cube selections for the filters, or None when the cube cannot answer them
+    def _cube_selections(self, selections, ranges):
+        selections = dict(selections)
+        price_range = ranges.get('Price')
+        age_range = ranges.get('Age')
+        if price_range is not None:
+            min_price, max_price = self.value_range('Price')
+            if price_range[0] > min_price or price_range[1] < max_price:
+                return None
+        if age_range is not None:
+            age_groups = age_group_filter(age_range, self.value_range('Age'))
+            if age_groups is False:
+                return None
+            if age_groups is not None:
+                selections['AgeGroup'] = age_groups
+        return selections
+
+
+# Quote a column name for SQL
+def _ident(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+# SQL expression bucketing Age like cube.age_groups (right-closed bins)
+def _age_group_sql():
+    cases = ' '.join(
+        f"WHEN {_ident('Age')} > {left} AND {_ident('Age')} <= {right} THEN '{label}'"
+        for label, left, right in zip(AGE_LABELS, AGE_BINS[:-1], AGE_BINS[1:])
+    )
+    return f"CASE {cases} END"
+
+
+# Embedded SQL backend. Filters and aggregations run in an in-process
+# DuckDB engine, directly on the dataset's Parquet file when it has one
+# (streamed datasets), so only the columns and row groups a query needs
+# are read. Rows held in memory are scanned in place. Row positions still
+# come from the in-memory index when the rows are loaded.
+class DuckDBBackend:
+    name = 'duckdb'
+
+    def __init__(self, dataset):
+        if duckdb is None:
+            raise ImportError("The duckdb query backend needs the duckdb package (pip install 'duckdb>=1.0')")
+        self.dataset = dataset
+        self._rows = PandasBackend(dataset)
+        self._con = duckdb.connect()
+        # One connection per dataset; queries from concurrent sessions take turns
+        self._lock = threading.Lock()
+        self._ranges = {}
+
+        source = getattr(dataset, 'source', None)
+        if source is not None and os.path.exists(source):
+            self._from = f"read_parquet({self._literal(source)})"
+        elif dataset.data is not None:
+            self._con.register('sales', dataset.data)
+            self._from = 'sales'
+        else:
+            raise ValueError("The dataset has neither rows in memory nor a Parquet file")
+        with self._lock:
+            self._columns = [row[0] for row in self._con.execute(f"DESCRIBE SELECT * FROM {self._from}").fetchall()]
+
+    @staticmethod
+    def _literal(text):
+        return "'" + str(text).replace("'", "''") + "'"
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._con.execute(sql, list(params)).df()
+
+    def value_range(self, col):
+        if col not in self._ranges:
+            bounds = self._query(f"SELECT min({_ident(col)}) AS lo, max({_ident(col)}) AS hi FROM {self._from}")
+            self._ranges[col] = (bounds['lo'].iloc[0], bounds['hi'].iloc[0])
+        return self._ranges[col]
+
+    def row_positions(self, date_range, selections, ranges):
+        return self._rows.row_positions(date_range, selections, ranges)
+
+    # Every filter is a scan of the source
+    def answers_from_cube(self, selections, ranges):
+        return False
+
+    # WHERE clause and parameters for a filter state
+    def _where(self, date_range, selections, ranges):
+        clauses = []
+        params = []
+        if date_range is not None:
+            clauses.append(f"{_ident('Date')} >= ? AND {_ident('Date')} < ?")
+            params += [pd.Timestamp(date_range[0]).to_pydatetime(), (pd.Timestamp(date_range[1]) + pd.Timedelta(days=1)).to_pydatetime()]
+        for col, values in selections.items():
+            values = [str(v) for v in values]
+            if not values:
+                clauses.append('FALSE')
+                continue
+            clauses.append(f"CAST({_ident(col)} AS VARCHAR) IN ({', '.join('?' for _ in values)})")
+            params += values
+        for col, bounds in ranges.items():
+            if bounds is None:
+                continue
+            clauses.append(f"{_ident(col)} BETWEEN ? AND ?")
+            params += [float(bounds[0]), float(bounds[1])]
+        return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', params
+
+    # Aggregate cube of the matching rows, grouped and summed in SQL
+    def filtered_cube(self, date_range, selections, ranges, row_positions=None):
+        dims = [d for d in CUBE_DIMENSIONS if d not in ('Date', 'AgeGroup') and d in self._columns]
+        select = [f"CAST(date_trunc('day', {_ident('Date')}) AS TIMESTAMP) AS {_ident('Date')}"]
+        select += [_ident(d) for d in dims]
+        select.append(f"{_age_group_sql()} AS {_ident('AgeGroup')}")
+        select.append(f"COUNT(*) AS {_ident('Count')}")
+        for m in CUBE_MEASURES:
+            value = f"CAST({_ident(m)} AS DOUBLE)"
+            select.append(f"SUM({value}) AS {_ident(m + '_sum')}")
+            select.append(f"SUM({value} * {value}) AS {_ident(m + '_sq')}")
+            select.append(f"COUNT({value}) AS {_ident(m + '_n')}")
+
+        where, params = self._where(date_range, selections, ranges)
+        cube = self._query(f"SELECT {', '.join(select)} FROM {self._from}{where} GROUP BY ALL", params)
+
+        # Same dtypes as a cube built in pandas
+        for m in CUBE_MEASURES:
+            for suffix in ('sum', 'sq', 'n'):
+                cube[f"{m}_{suffix}"] = cube[f"{m}_{suffix}"].astype('float64').fillna(0.0)
+        cube['Count'] = cube['Count'].astype('int64')
+        for d in dims:
+            cube[d] = cube[d].astype('category').cat.as_unordered()
+        cube['AgeGroup'] = pd.Categorical(cube['AgeGroup'], categories=AGE_LABELS, ordered=True)
+        cube['Date'] = pd.to_datetime(cube['Date'])
+        return cube
+
+
+# Backend for a shared dataset. Falls back to pandas when DuckDB was asked
+# for but is not installed or cannot read the dataset.
+def make_backend(dataset, name=QUERY_BACKEND):
+    if name == 'duckdb':
+        try:
+            return DuckDBBackend(dataset)
+        except Exception as e:
+            logger.warning("Falling back to the pandas query backend: %s", e)
+    elif name != 'pandas':
+        logger.warning("Unknown query backend '%s', using pandas", name)
+    return PandasBackend(dataset)
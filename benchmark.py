@@ -0,0 +1,208 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from ingest import read_sales_csv, load_cached_csv, stream_sales_csv
+from cube import build_cube, filter_cube, rollup, totals, share
+from filter_index import build_filter_index, filter_mask, date_window
+from forecasting import forecast_series, batch_forecast
+from charts import downsample, histogram_bins, binned_histogram
+from export import export_rows
+from synthetic import write_sales_csv
+import parallel
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+
+# Representative filter states: (name, date range as fractions of the
+# period, category selections, price range as quantiles or None)
+FILTERS = [
+    ('all', (0.0, 1.0), {}, None),
+    ('one_city', (0.0, 1.0), {'City': ['Pune']}, None),
+    ('quarter_two_items', (0.25, 0.5), {'ItemType': ['Books', 'Toys']}, None),
+    ('month_price_band', (0.5, 0.583), {'Gender': ['Female']}, (0.25, 0.75)),
+]
+
+# Cube roll-ups drawn by the dashboard: (name, dimensions, measures, aggregation)
+ROLLUPS = [
+    ('by_city', ['City'], ('Price',), 'sum'),
+    ('by_item_type', ['ItemType'], ('Price',), 'sum'),
+    ('by_gender', ['Gender'], ('Price',), 'sum'),
+    ('by_payment', ['Payment'], ('Price',), 'sum'),
+    ('by_return', ['Return'], ('Price',), 'sum'),
+    ('by_discount', ['Discount'], ('Price',), 'sum'),
+    ('by_age_group', ['AgeGroup'], ('Price',), 'sum'),
+    ('payment_by_age_group', ['AgeGroup', 'Payment'], ('Price',), 'sum'),
+    ('feedback_by_age_group', ['AgeGroup'], ('Feedback',), 'mean'),
+    ('daily_totals', ['Date'], ('Price', 'UnitsSold', 'Profit'), 'sum'),
+    ('product_sums', ['ItemType'], ('Price', 'UnitsSold', 'Profit'), 'sum'),
+    ('product_means', ['ItemType'], ('Price', 'UnitsSold', 'Profit', 'Feedback'), 'mean'),
+]
+
+
+# Highest resident set size of the process so far, in bytes
+def _max_rss():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+# Runs benchmark steps and collects one record per step
+class Recorder:
+    def __init__(self, n_rows, repeat):
+        self.n_rows = n_rows
+        self.repeat = repeat
+        self.records = []
+
+    # Time fn over repeat runs and record the best time, the rows per second
+    # it implies and the peak memory Python allocated during the first run
+    def run(self, step, fn, rows=None):
+        rows = self.n_rows if rows is None else rows
+        tracemalloc.start()
+        started = time.perf_counter()
+        result = fn()
+        best = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        for _ in range(self.repeat - 1):
+            started = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - started)
+
+        record = {
+            'rows': self.n_rows,
+            'step': step,
+            'seconds': round(best, 6),
+            'rows_per_second': round(rows / best) if best > 0 else None,
+            'peak_traced_bytes': peak,
+            'max_rss_bytes': _max_rss(),
+        }
+        self.records.append(record)
+        print(f"{self.n_rows:>12,}  {step:<32} {best:9.4f}s  {record['rows_per_second'] or 0:>14,} rows/s  {peak / 1024 ** 2:9.1f} MB")
+        return result
+
+
+# Filter state of a FILTERS entry resolved against a dataset
+def _resolve_filter(df, dates, price_quantiles, spec):
+    name, (lo, hi), selections, price = spec
+    first, last = dates
+    span = last - first
+    date_range = (first + span * lo, first + span * hi)
+    price_range = None
+    if price is not None:
+        price_range = (price_quantiles[price[0]], price_quantiles[price[1]])
+    return name, date_range, selections, price_range
+
+
+# Benchmark every stage of the dashboard pipeline on one dataset size
+def benchmark_size(n_rows, seed, workdir, repeat):
+    recorder = Recorder(n_rows, repeat)
+    csv_path = os.path.join(workdir, f"sales_{n_rows}.csv")
+
+    recorder.run('generate_csv', lambda: write_sales_csv(csv_path, n_rows, seed))
+    csv_bytes = os.path.getsize(csv_path)
+
+    # Ingest
+    df = recorder.run('ingest_csv', lambda: read_sales_csv(csv_path))
+    # First load into the column-store data cache, then reopening it
+    cache_dir = os.path.join(workdir, f"cache_{n_rows}")
+    recorder.run('ingest_colstore_cold', lambda: (shutil.rmtree(cache_dir, ignore_errors=True), load_cached_csv(csv_path, cache_dir))[1])
+    recorder.run('ingest_colstore_warm', lambda: load_cached_csv(csv_path, cache_dir))
+    stream_dir = os.path.join(workdir, f"stream_{n_rows}")
+    recorder.run('ingest_stream', lambda: (shutil.rmtree(stream_dir, ignore_errors=True), stream_sales_csv(csv_path, cache_dir=stream_dir))[1])
+
+    # Indexes built once per dataset
+    cube = recorder.run('build_cube', lambda: build_cube(df))
+    index = recorder.run('build_filter_index', lambda: build_filter_index(df))
+
+    # Filtering, through the bitmap index and through the cube
+    dates = (df['Date'].min(), df['Date'].max())
+    price_quantiles = df['Price'].quantile([0.25, 0.75]).to_dict()
+    filter_states = [_resolve_filter(df, dates, price_quantiles, spec) for spec in FILTERS]
+    positions = {}
+    for name, date_range, selections, price_range in filter_states:
+        def filter_rows():
+            window = date_window(index, date_range)
+            mask = filter_mask(index, selections, {'Price': price_range}, window)
+            return window[0] + np.flatnonzero(mask)
+        positions[name] = recorder.run(f"filter_rows[{name}]", filter_rows)
+        recorder.run(f"filter_cube[{name}]", lambda: filter_cube(cube, date_range, selections), rows=len(cube))
+
+    # Dashboard aggregations over the whole cube
+    for name, by, measures, agg in ROLLUPS:
+        recorder.run(f"rollup[{name}]", lambda: rollup(cube, by, measures, agg), rows=len(cube))
+    recorder.run('totals', lambda: totals(cube), rows=len(cube))
+    recorder.run('share[return_rate]', lambda: share(cube, 'Return', 'Returned'), rows=len(cube))
+
+    # Charts
+    daily = rollup(cube, 'Date', ('Price',))
+    recorder.run('downsample_daily', lambda: downsample(daily, 'Date', ['Price'], 200), rows=len(daily))
+    edges, codes = recorder.run('histogram_bins', lambda: histogram_bins(df['Price']))
+    recorder.run('histogram_counts', lambda: binned_histogram(codes, edges, positions['one_city']), rows=len(positions['one_city']))
+
+    # Forecasting
+    recorder.run('forecast_series', lambda: forecast_series(daily, 30, 'Price'), rows=len(daily))
+    recorder.run('batch_forecast', lambda: batch_forecast(cube, 30, 'Price'), rows=len(cube))
+
+    # Export of every row
+    all_rows = positions['all']
+    recorder.run('export_csv_gzip', lambda: export_rows(df, all_rows, 'CSV (gzip)').close())
+    recorder.run('export_parquet', lambda: export_rows(df, all_rows, 'Parquet').close())
+
+    os.remove(csv_path)
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    shutil.rmtree(stream_dir, ignore_errors=True)
+    return {'rows': n_rows, 'csv_bytes': csv_bytes, 'cube_rows': len(cube), 'steps': recorder.records}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Revify data pipeline on synthetic sales data.")
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_SIZES, help="dataset sizes to benchmark")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the synthetic data")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per step; the best time is reported")
+    parser.add_argument('--output', default='benchmark_results.json', help="JSON file the results are written to")
+    parser.add_argument('--workdir', help="directory for generated files (default: a temporary directory)")
+    args = parser.parse_args(argv)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='revify-bench-')
+    os.makedirs(workdir, exist_ok=True)
+    results = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'parallel_workers': parallel.PARALLEL_WORKERS,
+            'parallel_min_rows': parallel.PARALLEL_MIN_ROWS,
+            'seed': args.seed,
+            'repeat': args.repeat,
+        },
+        'sizes': [],
+    }
+    try:
+        for n_rows in args.rows:
+            results['sizes'].append(benchmark_size(n_rows, args.seed, workdir, max(1, args.repeat)))
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(args.output, 'w') as handle:
+        json.dump(results, handle, indent=2, default=str)
+    print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
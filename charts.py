@@ -0,0 +1,106 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+# Points drawn per time-series trace, roughly the pixel width of a chart
+CHART_MAX_POINTS = int(os.environ.get('REVIFY_CHART_MAX_POINTS', 1500))
+
+
+# Largest-Triangle-Three-Buckets: indices of n_out points that keep the
+# visual shape (peaks and troughs) of the series
+def lttb_indices(x, y, n_out):
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+    every = (n - 2) / (n_out - 2)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+
+    a = 0
+    for i in range(n_out - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        # Average of the next bucket; the last bucket looks at the end point
+        if end < next_end:
+            avg_x = x[end:next_end].mean()
+            avg_y = y[end:next_end].mean()
+        else:
+            avg_x = x[n - 1]
+            avg_y = y[n - 1]
+
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+
+    return selected
+
+
+# Reduce a frame to at most about max_points rows per column for plotting.
+# Rows are chosen with LTTB on each of the given columns and the union is
+# kept, so every column keeps its own peaks; other columns ride along.
+def downsample(frame, x, columns, max_points=CHART_MAX_POINTS):
+    if len(frame) <= max_points:
+        return frame
+
+    x_values = frame[x].to_numpy()
+    if np.issubdtype(x_values.dtype, np.datetime64):
+        x_values = x_values.astype('datetime64[ns]').astype('int64')
+
+    keep = []
+    for col in columns:
+        y_values = frame[col].to_numpy(dtype='float64', na_value=np.nan)
+        valid = np.flatnonzero(~np.isnan(y_values))
+        keep.append(valid[lttb_indices(x_values[valid], y_values[valid], max_points)])
+
+    return frame.iloc[np.unique(np.concatenate(keep))]
+
+
+# Bins per histogram
+HISTOGRAM_BINS = 50
+
+
+# Evenly spaced bin edges spanning a column. They are computed once per
+# dataset so the bins stay put while filters change.
+def histogram_edges(values, nbins=HISTOGRAM_BINS):
+    values = np.asarray(values, dtype='float64')
+    values = values[~np.isnan(values)]
+    if not len(values):
+        return np.linspace(0.0, 1.0, nbins + 1)
+    lo, hi = values.min(), values.max()
+    if lo == hi:
+        lo, hi = lo - 0.5, hi + 0.5
+    return np.linspace(lo, hi, nbins + 1)
+
+
+# Bin number of every value, -1 for missing values or values outside the
+# edges. The last bin includes its right edge.
+def bin_codes(values, edges):
+    values = np.asarray(values, dtype='float64')
+    nbins = len(edges) - 1
+    codes = np.searchsorted(edges, values, side='right') - 1
+    codes[values == edges[-1]] = nbins - 1
+    codes[np.isnan(values) | (codes < 0) | (codes >= nbins)] = -1
+    return codes.astype(np.int16)
+
+
+# Fixed bin edges for a column together with the bin of every row
+def histogram_bins(values, nbins=HISTOGRAM_BINS):
+    edges = histogram_edges(values, nbins)
+    return edges, bin_codes(values, edges)
+
+
+# Row counts per bin, optionally for a subset of row positions
+def binned_histogram(codes, edges, positions=None):
+    if positions is not None:
+        codes = codes[positions]
+    counts = np.bincount(codes[codes >= 0], minlength=len(edges) - 1)
+    return pd.DataFrame({'Start': edges[:-1], 'End': edges[1:], 'Count': counts})
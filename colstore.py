@@ -0,0 +1,89 @@
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+# Layout version of a column store directory
+STORE_VERSION = 1
+META_FILE = 'meta.json'
+
+
+# Write a frame as a column store: a directory with one .npy array per
+# column, a dictionary file per categorical column and meta.json tying
+# them together. Text columns are stored as categoricals. The directory
+# appears atomically, so readers never see a half-written store.
+def write_column_store(df, path):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    try:
+        columns = []
+        for i, name in enumerate(df.columns):
+            columns.append(_write_column(df[name], tmp_path, i))
+        with open(os.path.join(tmp_path, META_FILE), 'w') as handle:
+            json.dump({'version': STORE_VERSION, 'n_rows': len(df), 'columns': columns}, handle)
+        os.replace(tmp_path, path)
+    except Exception:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+
+
+def _write_column(series, path, i):
+    entry = {'name': series.name, 'file': f"{i}.npy"}
+    dtype = series.dtype
+
+    if isinstance(dtype, pd.DatetimeTZDtype) or pd.api.types.is_datetime64_dtype(dtype):
+        tz = str(dtype.tz) if isinstance(dtype, pd.DatetimeTZDtype) else None
+        values = series.dt.tz_convert('UTC').dt.tz_localize(None) if tz else series
+        values = values.to_numpy()
+        entry.update(kind='datetime', unit=np.datetime_data(values.dtype)[0], tz=tz)
+        np.save(os.path.join(path, entry['file']), values.view('int64'))
+    elif isinstance(dtype, np.dtype) and dtype.kind in 'biuf':
+        entry['kind'] = 'numeric'
+        np.save(os.path.join(path, entry['file']), series.to_numpy())
+    else:
+        categorical = series if isinstance(dtype, pd.CategoricalDtype) else series.astype('category')
+        entry.update(kind='category', dictionary=f"{i}.dict.json", ordered=bool(categorical.cat.ordered))
+        np.save(os.path.join(path, entry['file']), categorical.cat.codes.to_numpy())
+        with open(os.path.join(path, entry['dictionary']), 'w') as handle:
+            json.dump(categorical.cat.categories.tolist(), handle, default=str)
+
+    return entry
+
+
+# Open a column store as a frame backed by memory-mapped, read-only
+# arrays. Nothing is read up front: pages are loaded by the OS as columns
+# are touched and are shared with every process that opens the same store.
+def open_column_store(path, columns=None):
+    with open(os.path.join(path, META_FILE)) as handle:
+        meta = json.load(handle)
+    if meta.get('version') != STORE_VERSION:
+        raise ValueError(f"Unsupported column store version: {meta.get('version')}")
+
+    data = {}
+    for entry in meta['columns']:
+        if columns is not None and entry['name'] not in columns:
+            continue
+        values = np.load(os.path.join(path, entry['file']), mmap_mode='r')
+        if entry['kind'] == 'datetime':
+            values = values.view(f"datetime64[{entry['unit']}]")
+            if entry.get('tz'):
+                values = pd.DatetimeIndex(values).tz_localize('UTC').tz_convert(entry['tz'])
+        elif entry['kind'] == 'category':
+            with open(os.path.join(path, entry['dictionary'])) as handle:
+                categories = json.load(handle)
+            values = pd.Categorical.from_codes(
+                values,
+                dtype=pd.CategoricalDtype(categories, ordered=entry['ordered']),
+                validate=False
+            )
+        data[entry['name']] = values
+
+    return pd.DataFrame(data, copy=False)
+
+
+# Bytes on disk used by a column store
+def store_size(path):
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
@@ -0,0 +1,207 @@
+import numpy as np
+import pandas as pd
+
+from parallel import use_partitions, map_partitions
+
+# Age buckets shared with the Customer Analysis tab
+AGE_BINS = [0, 25, 35, 45, 55, 100]
+AGE_LABELS = ['0-25', '26-35', '36-45', '46-55', '55+']
+
+# Grain of the aggregate cube and the measures it holds. Every measure is
+# stored as <measure>_sum, <measure>_sq (sum of squares) and <measure>_n
+# (rows with a value) next to the row Count, which is enough to recover
+# sums, means, counts and standard deviations for any roll-up of the cube.
+# Missing values add nothing to a measure's sums or its _n.
+CUBE_DIMENSIONS = ['Date', 'Gender', 'City', 'ItemType', 'Payment', 'Return', 'Discount', 'AgeGroup']
+CUBE_MEASURES = ['Price', 'UnitsSold', 'Profit', 'Feedback']
+CUBE_VALUES = ['Count'] + [f"{m}_{suffix}" for m in CUBE_MEASURES for suffix in ('sum', 'sq', 'n')]
+
+
+# Bucket ages into the dashboard's age groups
+def age_groups(ages):
+    return pd.cut(ages, bins=AGE_BINS, labels=AGE_LABELS)
+
+
+# Aggregate raw rows to one row per dimension combination. Large
+# date-sorted frames are aggregated in parallel, one date range per
+# partition; the partial cubes share no dates, so they are simply stacked.
+# With weights, each row counts as that many rows, which turns a sample
+# into an estimate of the cube of the data it was drawn from.
+def build_cube(df, weights=None):
+    if weights is None and use_partitions(len(df)) and 'Date' in df.columns and df['Date'].is_monotonic_increasing:
+        partials = map_partitions(df, _build_cube, days=df['Date'].to_numpy())
+        return pd.concat(partials, ignore_index=True)
+    return _build_cube(df, weights)
+
+
+def _build_cube(df, weights=None):
+    dims = [d for d in CUBE_DIMENSIONS if d != 'AgeGroup' and d in df.columns]
+    work = df[dims].copy()
+    # The cube's time grain is one day
+    work['Date'] = work['Date'].dt.normalize()
+    work['AgeGroup'] = age_groups(df['Age'])
+    work['Count'] = 1 if weights is None else weights
+    for m in CUBE_MEASURES:
+        values = df[m].astype('float64')
+        present = values.notna().astype('float64')
+        weighted = values if weights is None else values * weights
+        work[f"{m}_sum"] = weighted
+        work[f"{m}_sq"] = weighted * values
+        work[f"{m}_n"] = present if weights is None else present * weights
+
+    cube = work.groupby(dims + ['AgeGroup'], observed=True, dropna=False, sort=False)[CUBE_VALUES].sum()
+    return cube.reset_index()
+
+
+# Combine partial cubes, e.g. one per ingested chunk, into a single cube
+def merge_cubes(cubes):
+    cubes = [c for c in cubes if c is not None and len(c)]
+    if not cubes:
+        return None
+    if len(cubes) == 1:
+        return cubes[0]
+
+    combined = _concat_cubes(cubes)
+    dims = [d for d in CUBE_DIMENSIONS if d in combined.columns]
+    cube = combined.groupby(dims, observed=True, dropna=False, sort=False)[CUBE_VALUES].sum()
+    return cube.reset_index()
+
+
+# Merges a stream of partial cubes, e.g. one per ingested chunk, without
+# regrouping everything merged so far on each one. Partials are merged in
+# pairs of equal depth like a binary counter, so every row is regrouped
+# about log2(chunks) times and only that many partials are held.
+class CubeMerger:
+    def __init__(self):
+        self._levels = []
+
+    def add(self, cube):
+        level = 0
+        while self._levels and self._levels[-1][0] == level:
+            _, previous = self._levels.pop()
+            cube = merge_cubes([previous, cube])
+            level += 1
+        self._levels.append((level, cube))
+
+    # The merged cube, or None when nothing was added
+    def result(self):
+        return merge_cubes([cube for _, cube in self._levels])
+
+
+# Stack cubes without regrouping them. Chunks carry different category
+# sets; concat falls back to plain values which are re-encoded once on the
+# stacked result.
+def _concat_cubes(cubes):
+    combined = pd.concat(cubes, ignore_index=True)
+    for col in CUBE_DIMENSIONS:
+        if col == 'Date' or col not in combined.columns:
+            continue
+        if col == 'AgeGroup':
+            combined[col] = pd.Categorical(combined[col], categories=AGE_LABELS, ordered=True)
+        else:
+            combined[col] = combined[col].astype('category')
+    return combined
+
+
+# Add the cube of newly appended rows to an existing cube. Only the days
+# from the first new day on are regrouped; earlier days are kept as they
+# are, so a day's new rows cost about one day of the cube.
+def append_cube(cube, delta):
+    if delta is None or not len(delta):
+        return cube
+    if cube is None or not len(cube):
+        return delta
+    overlap = (cube['Date'] >= delta['Date'].min()).to_numpy()
+    if not overlap.any():
+        return _concat_cubes([cube, delta])
+    return _concat_cubes([cube[~overlap], merge_cubes([cube[overlap], delta])])
+
+
+# Age groups covering exactly the ages in an inclusive range. Returns None
+# when the range spans every age in the data and False when it cuts
+# through an age group, in which case the cube cannot answer the filter.
+def age_group_filter(age_range, age_bounds):
+    lo, hi = age_range
+    if lo <= age_bounds[0] and hi >= age_bounds[1]:
+        return None
+    # Groups are right-closed: (0, 25], (25, 35], ...
+    lo_aligned = lo <= age_bounds[0] or (lo - 1) in AGE_BINS
+    hi_aligned = hi >= age_bounds[1] or hi in AGE_BINS
+    if not (lo_aligned and hi_aligned):
+        return False
+    return [
+        label for label, left, right in zip(AGE_LABELS, AGE_BINS[:-1], AGE_BINS[1:])
+        if max(left + 1, age_bounds[0]) >= lo and min(right, age_bounds[1]) <= hi
+    ]
+
+
+# Restrict the cube to a date range and to the selected category values.
+# selections maps a dimension name to the allowed values.
+def filter_cube(cube, date_range=None, selections=None):
+    mask = np.ones(len(cube), dtype=bool)
+    if date_range is not None:
+        start = pd.Timestamp(date_range[0])
+        end = pd.Timestamp(date_range[1])
+        mask &= ((cube['Date'] >= start) & (cube['Date'] <= end)).to_numpy()
+    for col, values in (selections or {}).items():
+        mask &= cube[col].isin(values).to_numpy()
+    return cube[mask]
+
+
+# Derive an aggregation of one measure from its cube columns
+def _aggregate(frame, measure, agg):
+    count = frame[f"{measure}_n"]
+    total = frame[f"{measure}_sum"]
+    if agg == 'sum':
+        return total
+    if agg == 'count':
+        return count
+    if agg == 'mean':
+        return total / count.where(count > 0)
+    if agg == 'std':
+        mean = total / count.where(count > 0)
+        var = (frame[f"{measure}_sq"] - count * mean * mean) / (count - 1).where(count > 1)
+        return np.sqrt(var.clip(lower=0))
+    raise ValueError(f"Unsupported cube aggregation: {agg}")
+
+
+# Roll the cube up to the given dimensions. The result has one column per
+# requested measure, named like the raw column so it can be charted the
+# same way as a groupby over rows.
+def rollup(cube, by, measures=('Price',), agg='sum'):
+    if isinstance(by, str):
+        by = [by]
+    by = list(by)
+    if use_partitions(len(cube)):
+        # Partial sums per partition, merged into the final sums. Counts,
+        # means and deviations are derived from the merged sums below.
+        partials = map_partitions(
+            cube,
+            lambda part: part.groupby(by, observed=True, sort=False)[CUBE_VALUES].sum()
+        )
+        grouped = pd.concat(partials).groupby(level=by, observed=True, sort=True).sum()
+    else:
+        grouped = cube.groupby(by, observed=True, sort=True)[CUBE_VALUES].sum()
+    result = pd.DataFrame(index=grouped.index)
+    for m in measures:
+        result[m] = _aggregate(grouped, m, agg)
+    return result.reset_index()
+
+
+# Grand totals of the cube as a dict of Count and <measure>_sum/_mean
+def totals(cube):
+    sums = cube[CUBE_VALUES].sum()
+    result = {'Count': sums['Count']}
+    for m in CUBE_MEASURES:
+        count = sums[f"{m}_n"]
+        result[f"{m}_sum"] = sums[f"{m}_sum"]
+        result[f"{m}_mean"] = sums[f"{m}_sum"] / count if count else np.nan
+    return result
+
+
+# Share of rows where a dimension takes the given value, in percent
+def share(cube, col, value):
+    count = cube['Count'].sum()
+    if not count:
+        return np.nan
+    return cube.loc[cube[col] == value, 'Count'].sum() / count * 100
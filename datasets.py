@@ -0,0 +1,195 @@
+import hashlib
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+from backends import make_backend
+from cube import build_cube, append_cube
+from filter_index import build_filter_index, extend_filter_index
+from ingest import conform_rows, append_rows, SALES_COLUMNS
+from result_cache import sizeof
+from sampling import StratifiedSample
+
+# Memory budget for datasets no session is using any more. Datasets that
+# are still open are never evicted, whatever their size.
+DATASET_MAX_BYTES = int(os.environ.get('REVIFY_DATASET_MAX_BYTES', 4 * 1024 ** 3))
+
+
+# One loaded dataset shared by every session that opened the same content:
+# the rows (None for streamed data), the aggregate cube and the filter
+# index, each built once, plus the Parquet file holding the rows on disk
+# when there is one. Callers must treat all of it as read-only.
+class SharedDataset:
+    def __init__(self, key, data=None, cube=None, source=None, filter_index=None):
+        self.key = key
+        self.data = data
+        self._cube = cube
+        self.source = source
+        self._filter_index = filter_index
+        self._sample = None
+        self._backend = None
+        self.refcount = 0
+        self.last_used = time.time()
+        self._nbytes = None
+        self._lock = threading.Lock()
+
+    # Aggregate cube, built by the first session that needs it
+    @property
+    def cube(self):
+        if self._cube is None:
+            with self._lock:
+                if self._cube is None:
+                    self._cube = build_cube(self.data)
+                    self._nbytes = None
+        return self._cube
+
+    # Bitmap filter index over the rows, or None for streamed data
+    @property
+    def filter_index(self):
+        if self._filter_index is None and self.data is not None:
+            with self._lock:
+                if self._filter_index is None:
+                    self._filter_index = build_filter_index(self.data)
+                    self._nbytes = None
+        return self._filter_index
+
+    # Stratified sample behind approximate results, or None for streamed data
+    @property
+    def sample(self):
+        if self._sample is None and self.data is not None:
+            with self._lock:
+                if self._sample is None:
+                    self._sample = StratifiedSample(self.data)
+                    self._nbytes = None
+        return self._sample
+
+    # Query backend (REVIFY_QUERY_BACKEND), created on first use and freed
+    # with the dataset
+    @property
+    def backend(self):
+        if self._backend is None:
+            with self._lock:
+                if self._backend is None:
+                    self._backend = make_backend(self)
+        return self._backend
+
+    @property
+    def nbytes(self):
+        if self._nbytes is None:
+            self._nbytes = sizeof(self.data) + sizeof(self._cube) + sizeof(self._filter_index)
+            if self._sample is not None:
+                self._nbytes += self._sample.nbytes
+        return self._nbytes
+
+
+# A session's reference to a shared dataset. The reference is released by
+# release() or, for sessions that simply go away, when the handle is
+# garbage collected with the session state.
+class DatasetHandle:
+    def __init__(self, registry, dataset):
+        self.dataset = dataset
+        self.key = dataset.key
+        self._finalizer = weakref.finalize(self, registry.release, dataset.key)
+
+    def release(self):
+        self._finalizer()
+
+
+# Process-wide registry of loaded datasets keyed by content hash, so
+# sessions looking at the same data share one copy of it
+class DatasetRegistry:
+    def __init__(self, max_bytes=DATASET_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._loading = {}
+        self._lock = threading.Lock()
+
+    # Handle to the dataset with the given content key. load() is called
+    # only when no session has it loaded and returns (rows, cube), optionally
+    # followed by the source file and filter index; rows or cube may be
+    # None. Concurrent opens of the same key load it once.
+    def open(self, key, load):
+        with self._lock:
+            dataset = self._entries.get(key)
+            key_lock = None if dataset is not None else self._loading.setdefault(key, threading.Lock())
+
+        if dataset is None:
+            with key_lock:
+                with self._lock:
+                    dataset = self._entries.get(key)
+                if dataset is None:
+                    loaded = load()
+                    if loaded[0] is None and loaded[1] is None:
+                        return None
+                    dataset = SharedDataset(key, *loaded)
+                    with self._lock:
+                        self._entries[key] = dataset
+                        self._loading.pop(key, None)
+
+        with self._lock:
+            dataset.refcount += 1
+            dataset.last_used = time.time()
+            self._entries.move_to_end(key)
+        return DatasetHandle(self, dataset)
+
+    # Handle to the dataset an open dataset becomes with new rows appended.
+    # rows_key identifies the new rows' content; sessions appending the same
+    # rows to the same dataset share the result. Only the new rows are
+    # validated, aggregated and indexed: the cube and filter index are
+    # extended rather than rebuilt. Rows that arrive out of date order
+    # re-sort the data, and the filter index is then rebuilt when needed.
+    def append(self, handle, rows, rows_key):
+        base = handle.dataset
+        key = hashlib.sha256(f"{base.key}+{rows_key}".encode()).hexdigest()
+
+        def load():
+            if base.data is None:
+                # Streamed data: only the aggregate cube is kept
+                rows_conformed = conform_rows(rows, SALES_COLUMNS)
+                return None, append_cube(base.cube, build_cube(rows_conformed))
+            rows_conformed = conform_rows(rows, base.data.columns)
+            data, in_order = append_rows(base.data, rows_conformed)
+            index = base._filter_index
+            index = extend_filter_index(index, data) if index is not None and in_order else None
+            return data, append_cube(base.cube, build_cube(rows_conformed)), None, index
+
+        return self.open(key, load)
+
+    # Drop one session's reference and evict unused datasets over budget
+    def release(self, key):
+        with self._lock:
+            dataset = self._entries.get(key)
+            if dataset is None:
+                return
+            dataset.refcount = max(dataset.refcount - 1, 0)
+            dataset.last_used = time.time()
+            self._evict()
+
+    # Remove least recently used datasets that no session holds until the
+    # registry fits its budget
+    def _evict(self):
+        total = sum(dataset.nbytes for dataset in self._entries.values())
+        for key in list(self._entries):
+            if total <= self.max_bytes:
+                break
+            dataset = self._entries[key]
+            if dataset.refcount:
+                continue
+            total -= dataset.nbytes
+            del self._entries[key]
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            entries = list(self._entries.values())
+            return {
+                'datasets': len(entries),
+                'open': sum(1 for dataset in entries if dataset.refcount),
+                'sessions': sum(dataset.refcount for dataset in entries),
+                'bytes': sum(dataset.nbytes for dataset in entries),
+                'max_bytes': self.max_bytes,
+                'evictions': self.evictions,
+            }
@@ -0,0 +1,65 @@
+import gzip
+import io
+import os
+import tempfile
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Rows converted per chunk while writing an export
+EXPORT_CHUNK_ROWS = int(os.environ.get('REVIFY_EXPORT_CHUNK_ROWS', 100_000))
+
+# Download formats: label -> (file extension, MIME type)
+EXPORT_FORMATS = {
+    'CSV': ('csv', 'text/csv'),
+    'CSV (gzip)': ('csv.gz', 'application/gzip'),
+    'Parquet': ('parquet', 'application/vnd.apache.parquet'),
+}
+
+
+# Slices of the selected rows, chunk_rows at a time
+def _chunks(df, positions, chunk_rows):
+    for start in range(0, len(positions), chunk_rows):
+        yield df.iloc[positions[start:start + chunk_rows]]
+
+
+# Write the rows at the given positions as CSV, chunk by chunk, so the full
+# text is never held in memory at once
+def write_csv(df, positions, out, chunk_rows=EXPORT_CHUNK_ROWS):
+    header = True
+    for chunk in _chunks(df, positions, chunk_rows):
+        out.write(chunk.to_csv(index=False, header=header).encode('utf-8'))
+        header = False
+    if header:
+        out.write(df.head(0).to_csv(index=False).encode('utf-8'))
+
+
+# Write the rows at the given positions as Parquet, one row group per chunk
+def write_parquet(df, positions, out, chunk_rows=EXPORT_CHUNK_ROWS):
+    schema = pa.Schema.from_pandas(df.head(0), preserve_index=False)
+    with pq.ParquetWriter(out, schema, compression='snappy') as writer:
+        for chunk in _chunks(df, positions, chunk_rows):
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+
+
+# Export the rows at the given positions in one of EXPORT_FORMATS. Returns
+# an unbuffered temporary file rewound to the start, a file type Streamlit's
+# download button accepts; the export is written to disk, not held in
+# memory while it is built.
+def export_rows(df, positions, fmt, chunk_rows=EXPORT_CHUNK_ROWS):
+    raw = tempfile.TemporaryFile(buffering=0)
+    out = io.BufferedWriter(raw)
+    if fmt == 'CSV':
+        write_csv(df, positions, out, chunk_rows)
+    elif fmt == 'CSV (gzip)':
+        with gzip.GzipFile(fileobj=out, mode='wb', compresslevel=6) as compressed:
+            write_csv(df, positions, compressed, chunk_rows)
+    elif fmt == 'Parquet':
+        write_parquet(df, positions, out, chunk_rows)
+    else:
+        raw.close()
+        raise ValueError(f"Unsupported export format: {fmt}")
+    out.flush()
+    out.detach()
+    raw.seek(0)
+    return raw
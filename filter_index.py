@@ -0,0 +1,218 @@
+import numpy as np
+import pandas as pd
+
+# Columns that get one bitmap per distinct value
+BITMAP_COLUMNS = ['Gender', 'City', 'ItemType', 'Payment', 'Return', 'Discount']
+# Numeric columns filtered by range through a precomputed sort order
+RANGE_COLUMNS = ['Price', 'Age']
+
+
+# Build the filter index for a dataset. Bitmaps are bit-packed boolean
+# masks (one bit per row), so combining them with bitwise AND/OR touches
+# an eighth of the memory a boolean mask comparison would.
+def build_filter_index(df):
+    index = {'n_rows': len(df), 'bitmaps': {}, 'present': {}, 'sorted': {}, 'dates': None}
+
+    for col in BITMAP_COLUMNS:
+        if col not in df.columns:
+            continue
+        codes, uniques = pd.factorize(df[col])
+        index['bitmaps'][col] = {
+            value: np.packbits(codes == code)
+            for code, value in enumerate(uniques)
+        }
+        # Rows with a missing value are in no bitmap; remember which rows do
+        # have one so complements never let missing values through
+        index['present'][col] = np.packbits(codes >= 0) if (codes < 0).any() else None
+
+    for col in RANGE_COLUMNS:
+        if col not in df.columns:
+            continue
+        values = df[col].to_numpy()
+        sort_values = df[col].to_numpy(dtype='float64', na_value=np.nan)
+        order = np.argsort(sort_values, kind='stable')
+        sorted_values = sort_values[order]
+        valid = int((~np.isnan(sorted_values)).sum())
+        index['sorted'][col] = {
+            'values': sorted_values,
+            'order': order,
+            'raw': values,
+            # Full-range filters are skipped, but only when no row is missing
+            'bounds': (sorted_values[0], sorted_values[valid - 1]) if valid == len(values) and valid else None,
+        }
+
+    # Date-sorted data is pruned by binary search instead of compared row by
+    # row
+    if 'Date' in df.columns and df['Date'].is_monotonic_increasing:
+        index['dates'] = df['Date'].to_numpy()
+
+    return index
+
+
+# Extend a filter index built over the leading rows of df to every row of
+# df. Only the appended rows are factorized and sorted; they are merged
+# into the existing bitmaps and sort orders instead of indexing every row
+# again. The appended rows must come after the indexed ones.
+def extend_filter_index(index, df):
+    n_old = index['n_rows']
+    new = df.iloc[n_old:]
+    extended = {'n_rows': len(df), 'bitmaps': {}, 'present': {}, 'sorted': {}, 'dates': None}
+
+    for col, bitmaps in index['bitmaps'].items():
+        codes, uniques = pd.factorize(new[col])
+        new_codes = {value: code for code, value in enumerate(uniques)}
+        values = list(bitmaps) + [value for value in uniques if value not in bitmaps]
+        extended['bitmaps'][col] = {
+            value: _append_bits(
+                bitmaps.get(value),
+                n_old,
+                codes == new_codes[value] if value in new_codes else np.zeros(len(new), dtype=bool)
+            )
+            for value in values
+        }
+        present = index['present'][col]
+        if present is None and not (codes < 0).any():
+            extended['present'][col] = None
+        else:
+            if present is None:
+                present = np.packbits(np.ones(n_old, dtype=bool))
+            extended['present'][col] = _append_bits(present, n_old, codes >= 0)
+
+    for col, entry in index['sorted'].items():
+        new_values = new[col].to_numpy(dtype='float64', na_value=np.nan)
+        new_order = np.argsort(new_values, kind='stable')
+        new_sorted = new_values[new_order]
+        # New rows follow equal existing values, as a stable sort of all
+        # rows would place them
+        at = np.searchsorted(entry['values'], new_sorted, side='right')
+        sorted_values = np.insert(entry['values'], at, new_sorted)
+        order = np.insert(entry['order'], at, new_order + n_old)
+        valid = int((~np.isnan(sorted_values)).sum())
+        extended['sorted'][col] = {
+            'values': sorted_values,
+            'order': order,
+            'raw': df[col].to_numpy(),
+            'bounds': (sorted_values[0], sorted_values[valid - 1]) if valid == len(df) and valid else None,
+        }
+
+    if index['dates'] is not None and new['Date'].is_monotonic_increasing and (
+        not len(new) or not n_old or new['Date'].iloc[0] >= index['dates'][-1]
+    ):
+        extended['dates'] = df['Date'].to_numpy()
+
+    return extended
+
+
+# Packed bitmap over n_rows rows with a boolean mask added at the end.
+# bits of None stands for an all-zero bitmap.
+def _append_bits(bits, n_rows, mask):
+    if bits is None:
+        bits = np.zeros((n_rows + 7) // 8, dtype=np.uint8)
+    full = n_rows // 8
+    tail = np.unpackbits(bits[full:], count=n_rows % 8).view(bool)
+    return np.concatenate([bits[:full], np.packbits(np.concatenate([tail, mask]))])
+
+
+# Row window (start, stop) holding the dates in an inclusive date range, or
+# None when the data is not date-sorted
+def date_window(index, date_range):
+    dates = index['dates']
+    if dates is None:
+        return None
+    start = pd.Timestamp(date_range[0]).to_datetime64().astype(dates.dtype)
+    end = (pd.Timestamp(date_range[1]) + pd.Timedelta(days=1)).to_datetime64().astype(dates.dtype)
+    return (
+        int(np.searchsorted(dates, start, side='left')),
+        int(np.searchsorted(dates, end, side='left'))
+    )
+
+
+# Bytes of a packed bitmap that cover a row window
+def _slice_bits(bits, window):
+    return bits[window[0] // 8:(window[1] + 7) // 8]
+
+
+# Pack a boolean mask over a row window so it lines up with sliced bitmaps
+def _pack_window(mask, window):
+    offset = window[0] % 8
+    if offset:
+        mask = np.concatenate([np.zeros(offset, dtype=bool), mask])
+    return np.packbits(mask)
+
+
+# Bitmap of the rows whose value is one of the selected values. Large
+# selections are answered as the complement of the values left out so the
+# work scales with the smaller of the two sets.
+def _values_bitmap(index, col, values, window):
+    bitmaps = index['bitmaps'][col]
+    selected = set(values)
+    chosen = [_slice_bits(bits, window) for value, bits in bitmaps.items() if value in selected]
+    if len(chosen) * 2 <= len(bitmaps):
+        return _union(chosen, window)
+
+    missing = [_slice_bits(bits, window) for value, bits in bitmaps.items() if value not in selected]
+    result = np.bitwise_not(_union(missing, window))
+    if index['present'][col] is not None:
+        np.bitwise_and(result, _slice_bits(index['present'][col], window), out=result)
+    return result
+
+
+# Bitwise OR of a list of bitmaps
+def _union(bitmaps, window):
+    if not bitmaps:
+        return np.zeros((window[1] + 7) // 8 - window[0] // 8, dtype=np.uint8)
+    result = bitmaps[0].copy()
+    for bits in bitmaps[1:]:
+        np.bitwise_or(result, bits, out=result)
+    return result
+
+
+# Bitmap of the rows with lo <= value <= hi. Over the whole dataset this
+# comes from the sort order; inside a narrower date window comparing the
+# window's values directly is cheaper.
+def _range_bitmap(index, col, lo, hi, window):
+    if window != (0, index['n_rows']):
+        values = index['sorted'][col]['raw'][window[0]:window[1]]
+        return _pack_window((values >= lo) & (values <= hi), window)
+
+    sorted_values = index['sorted'][col]['values']
+    order = index['sorted'][col]['order']
+    start = np.searchsorted(sorted_values, lo, side='left')
+    stop = np.searchsorted(sorted_values, hi, side='right')
+    mask = np.zeros(index['n_rows'], dtype=bool)
+    mask[order[start:stop]] = True
+    return np.packbits(mask)
+
+
+# Boolean row mask for a set of filters. selections maps a bitmap column to
+# the allowed values and ranges maps a range column to an inclusive
+# (low, high) pair. Filters that select everything are skipped outright.
+# With a row window the mask covers only rows window[0]:window[1].
+def filter_mask(index, selections=None, ranges=None, window=None):
+    if window is None:
+        window = (0, index['n_rows'])
+    result = None
+
+    for col, values in (selections or {}).items():
+        if values is None or col not in index['bitmaps']:
+            continue
+        if index['present'][col] is None and set(index['bitmaps'][col]).issubset(set(values)):
+            continue
+        bits = _values_bitmap(index, col, values, window)
+        result = bits if result is None else np.bitwise_and(result, bits, out=result)
+
+    for col, bounds in (ranges or {}).items():
+        if bounds is None or col not in index['sorted']:
+            continue
+        lo, hi = bounds
+        full = index['sorted'][col]['bounds']
+        if full is not None and lo <= full[0] and hi >= full[1]:
+            continue
+        bits = _range_bitmap(index, col, lo, hi, window)
+        result = bits if result is None else np.bitwise_and(result, bits, out=result)
+
+    n_rows = window[1] - window[0]
+    if result is None:
+        return np.ones(n_rows, dtype=bool)
+    offset = window[0] % 8
+    return np.unpackbits(result, count=offset + n_rows)[offset:].view(bool)
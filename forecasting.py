@@ -0,0 +1,115 @@
+import hashlib
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+from result_cache import ResultCache
+
+FORECAST_DEGREE = 2
+
+# Fitted coefficients by series content and degree. Coefficients are tiny,
+# so the budget only guards against unbounded growth.
+_fit_cache = ResultCache(max_bytes=16 * 1024 ** 2)
+
+
+# Design matrix [1, x, x^2, ...] for time steps scaled by the series length,
+# which keeps the least-squares problem well conditioned for long series
+def _design_matrix(steps, scale, degree):
+    return np.vander(np.asarray(steps, dtype='float64') / scale, degree + 1, increasing=True)
+
+
+# Fit a polynomial trend to an evenly indexed series with a direct
+# least-squares solve
+def fit_trend(values, degree=FORECAST_DEGREE):
+    y = np.asarray(values, dtype='float64')
+    scale = max(len(y) - 1, 1)
+    coefficients, *_ = np.linalg.lstsq(_design_matrix(np.arange(len(y)), scale, degree), y, rcond=None)
+    return coefficients, scale
+
+
+# Fitted trend for a series, reused across reruns while the series is
+# unchanged
+def cached_fit(values, degree=FORECAST_DEGREE):
+    y = np.ascontiguousarray(values, dtype='float64')
+    key = (hashlib.sha1(y.tobytes()).hexdigest(), len(y), degree)
+    return _fit_cache.get_or_compute(key, lambda: fit_trend(y, degree))
+
+
+# Extend a fitted trend by the given number of steps past the series end
+def predict_trend(fit, n_observed, horizon, degree=FORECAST_DEGREE):
+    coefficients, scale = fit
+    steps = np.arange(n_observed, n_observed + horizon)
+    return _design_matrix(steps, scale, degree) @ coefficients
+
+
+# Forecast the next days of a daily series given as a frame with a Date
+# column and the metric column
+def forecast_series(data, days_to_forecast=30, metric='Price', degree=FORECAST_DEGREE):
+    data = data.sort_values('Date')
+    values = data[metric].to_numpy()
+    fit = cached_fit(values, degree)
+    predictions = predict_trend(fit, len(values), days_to_forecast, degree)
+
+    last_date = data['Date'].max()
+    future_dates = pd.date_range(start=last_date + timedelta(days=1), periods=days_to_forecast)
+    return future_dates, predictions
+
+
+# Forecast many daily series in one least-squares solve. wide is indexed
+# by date with one column per series; all series share the time axis.
+def forecast_many(wide, days_to_forecast=30, degree=FORECAST_DEGREE):
+    y = wide.to_numpy(dtype='float64')
+    n_observed = len(wide)
+    scale = max(n_observed - 1, 1)
+    coefficients, *_ = np.linalg.lstsq(_design_matrix(np.arange(n_observed), scale, degree), y, rcond=None)
+    predictions = predict_trend((coefficients, scale), n_observed, days_to_forecast, degree)
+
+    future_dates = pd.date_range(start=wide.index.max() + timedelta(days=1), periods=days_to_forecast, name='Date')
+    return pd.DataFrame(predictions, index=future_dates, columns=wide.columns)
+
+
+# Series levels forecast for replenishment planning
+BATCH_LEVELS = [
+    ('ItemType', ['ItemType']),
+    ('City', ['City']),
+    ('ItemType × City', ['ItemType', 'City']),
+]
+
+
+# Forecast every ItemType, City and ItemType × City series of a cube at
+# once. Days without sales count as zero so all series share one date
+# axis. Returns a long table with Level, ItemType, City, Date and the
+# forecast value; ItemType or City is 'All' where a level spans them.
+def batch_forecast(cube, days_to_forecast=30, metric='Price', degree=FORECAST_DEGREE):
+    dates = pd.DatetimeIndex(np.sort(cube['Date'].unique()), name='Date')
+    columns = []
+    blocks = []
+    for level, dims in BATCH_LEVELS:
+        wide = cube.pivot_table(
+            index='Date',
+            columns=dims,
+            values=f"{metric}_sum",
+            aggfunc='sum',
+            observed=True,
+            fill_value=0
+        ).reindex(dates, fill_value=0)
+        blocks.append(wide.to_numpy(dtype='float64'))
+        for key in wide.columns:
+            key = key if isinstance(key, tuple) else (key,)
+            labels = dict(zip(dims, key))
+            columns.append((level, labels.get('ItemType', 'All'), labels.get('City', 'All')))
+
+    wide = pd.DataFrame(
+        np.hstack(blocks),
+        index=dates,
+        columns=pd.MultiIndex.from_tuples(columns, names=['Level', 'ItemType', 'City'])
+    )
+    predictions = forecast_many(wide, days_to_forecast, degree)
+    forecast = predictions.T.reset_index().melt(
+        id_vars=['Level', 'ItemType', 'City'],
+        var_name='Date',
+        value_name=f"Forecast {metric}"
+    )
+    forecast['Date'] = pd.to_datetime(forecast['Date'])
+    return forecast.sort_values(['Level', 'ItemType', 'City', 'Date'], ignore_index=True)
@@ -0,0 +1,345 @@
+import hashlib
+import io
+import json
+import os
+import shutil
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pandas.api.types import union_categoricals
+
+from cube import build_cube, CubeMerger
+from colstore import write_column_store, open_column_store, store_size
+
+# Column layout of a Revify sales export
+CATEGORY_COLUMNS = ['Gender', 'City', 'ItemType', 'Payment', 'Return', 'Discount']
+INTEGER_COLUMNS = ['Age', 'UnitsSold']
+FLOAT_COLUMNS = ['Feedback']
+# Currency columns stay 64-bit: they are summed into dashboard totals and
+# float32 accumulation drops the cents on large exports
+CURRENCY_COLUMNS = ['Price', 'Profit']
+DATE_COLUMN = 'Date'
+DATE_FORMAT = '%Y-%m-%d'
+SALES_COLUMNS = CATEGORY_COLUMNS + INTEGER_COLUMNS + FLOAT_COLUMNS + CURRENCY_COLUMNS + [DATE_COLUMN]
+
+# Dtypes that can be handed straight to the CSV parser. Integer columns are
+# parsed normally and downcast afterwards so a stray blank cell does not
+# abort the whole load.
+CSV_DTYPES = {
+    **{col: 'category' for col in CATEGORY_COLUMNS},
+    **{col: 'float32' for col in FLOAT_COLUMNS},
+    **{col: 'float64' for col in CURRENCY_COLUMNS},
+}
+
+
+# Parse the Date column with the fixed export format, falling back to
+# pandas' format inference for files that use another layout
+def parse_dates(values):
+    try:
+        return pd.to_datetime(values, format=DATE_FORMAT)
+    except (ValueError, TypeError):
+        return pd.to_datetime(values)
+
+
+# Convert a raw sales frame to compact dtypes: categoricals for the
+# low-cardinality text columns and the smallest numeric types that hold
+# the values
+def optimize_dtypes(df):
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype('category')
+
+    for col in INTEGER_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], downcast='integer')
+
+    for col in FLOAT_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], downcast='float')
+
+    for col in CURRENCY_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col]).astype('float64')
+
+    if DATE_COLUMN in df.columns and not pd.api.types.is_datetime64_any_dtype(df[DATE_COLUMN]):
+        df[DATE_COLUMN] = parse_dates(df[DATE_COLUMN])
+
+    return df
+
+
+# Sort rows by date so date ranges map to contiguous row windows
+def sort_by_date(df):
+    if DATE_COLUMN in df.columns and not df[DATE_COLUMN].is_monotonic_increasing:
+        df = df.sort_values(DATE_COLUMN, kind='stable', ignore_index=True)
+    return df
+
+
+# Read a sales CSV with explicit dtypes set up front, sorted by date
+def read_sales_csv(file):
+    df = pd.read_csv(file, dtype=CSV_DTYPES)
+    return sort_by_date(optimize_dtypes(df))
+
+
+# Check new rows against the columns of the data they are appended to and
+# convert them to the dashboard's types, sorted by date. Raises ValueError
+# when a column is missing or its values cannot be converted.
+def conform_rows(rows, columns):
+    missing = [col for col in columns if col not in rows.columns]
+    if missing:
+        raise ValueError(f"New rows are missing columns: {', '.join(missing)}")
+    if not len(rows):
+        raise ValueError("There are no new rows to append")
+    try:
+        rows = optimize_dtypes(rows[list(columns)].copy())
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"New rows do not match the data: {e}") from e
+    return sort_by_date(rows)
+
+
+# Stack sales frames with the same columns. Categorical columns keep the
+# first frame's codes and gain the values of later frames; numeric columns
+# widen when later values need it.
+def combine_frames(frames):
+    columns = {}
+    for col in frames[0].columns:
+        if isinstance(frames[0][col].dtype, pd.CategoricalDtype):
+            columns[col] = union_categoricals([frame[col].astype('category').array for frame in frames])
+        else:
+            columns[col] = pd.concat([frame[col] for frame in frames], ignore_index=True)
+    return pd.DataFrame(columns, copy=False)
+
+
+# Append conformed rows to a sales frame. Returns the combined frame and
+# whether the new rows all come after the existing ones, in which case the
+# existing rows keep their positions and everything built over them stays
+# valid.
+def append_rows(df, rows):
+    combined = combine_frames([df, rows])
+
+    in_order = (
+        DATE_COLUMN not in df.columns or not len(df) or
+        (df[DATE_COLUMN].is_monotonic_increasing and rows[DATE_COLUMN].iloc[0] >= df[DATE_COLUMN].iloc[-1])
+    )
+    if not in_order:
+        combined = sort_by_date(combined)
+    return combined, bool(in_order)
+
+
+# On-disk cache of parsed uploads, keyed by a hash of the file contents
+CACHE_DIR = os.environ.get('REVIFY_CACHE_DIR', '.revify_cache')
+CACHE_MAX_BYTES = int(os.environ.get('REVIFY_CACHE_MAX_BYTES', 2 * 1024 ** 3))
+# Bump when the parsed schema changes so stale cache entries are not reused
+CACHE_VERSION = '2'
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+# Hash a file path or file-like object by content without reading it into
+# memory in one piece
+def hash_file(file):
+    digest = hashlib.sha256(CACHE_VERSION.encode())
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, 'rb') as handle:
+            for chunk in iter(lambda: handle.read(HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+    else:
+        file.seek(0)
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+        file.seek(0)
+    return digest.hexdigest()
+
+
+# Content key of a sales file. For paths, the key from the last hash is
+# remembered next to the cache together with the file's size and
+# modification time, so reopening an unchanged large file skips reading it.
+def file_key(file, cache_dir=CACHE_DIR):
+    if not isinstance(file, (str, os.PathLike)):
+        return hash_file(file)
+
+    stat = os.stat(file)
+    memo = os.path.join(cache_dir, 'keys', f"{hashlib.sha1(os.path.abspath(file).encode()).hexdigest()}.json")
+    try:
+        with open(memo) as handle:
+            saved = json.load(handle)
+        if (saved['size'], saved['mtime_ns'], saved['version']) == (stat.st_size, stat.st_mtime_ns, CACHE_VERSION):
+            return saved['key']
+    except (OSError, ValueError, KeyError):
+        pass
+
+    key = hash_file(file)
+    try:
+        os.makedirs(os.path.dirname(memo), exist_ok=True)
+        with open(memo, 'w') as handle:
+            json.dump({'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'version': CACHE_VERSION, 'key': key}, handle)
+    except OSError:
+        pass
+    return key
+
+
+# Drop the least recently used cache entries until the cache fits its
+# size budget. The entry that was just written is never evicted.
+def evict_cache(cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES, keep=None):
+    entries = []
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if name.endswith('.parquet'):
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+        elif name.endswith('.cols') and os.path.isdir(path):
+            entries.append((os.stat(path).st_mtime, store_size(path), path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if path == keep:
+            continue
+        try:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+
+# Load a sales CSV through the on-disk cache. The first load of a file is
+# parsed from CSV and written out as a column store; later loads of the
+# same content, including after a restart or from another process, map
+# the stored columns instead of reading them.
+def load_cached_csv(file, cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+    key = file_key(file, cache_dir)
+    path = os.path.join(cache_dir, f"{key}.cols")
+
+    if os.path.isdir(path):
+        try:
+            df = open_column_store(path)
+            os.utime(path)  # mark as recently used for eviction
+            return df
+        except Exception:
+            # Corrupt or unreadable entry, rebuild it from the CSV below
+            shutil.rmtree(path, ignore_errors=True)
+
+    df = read_sales_csv(file)
+
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        write_column_store(df, path)
+        evict_cache(cache_dir, max_bytes, keep=path)
+        # Serve the mapped copy so the parsed frame can be freed
+        return open_column_store(path)
+    except Exception:
+        # The cache is an optimisation only; a read-only or full disk must
+        # not stop the data from loading
+        return df
+
+
+# Streaming ingestion for files that do not fit in memory
+STREAM_CHUNK_ROWS = int(os.environ.get('REVIFY_STREAM_CHUNK_ROWS', 250_000))
+STREAM_THRESHOLD_BYTES = int(os.environ.get('REVIFY_STREAM_THRESHOLD_BYTES', 512 * 1024 ** 2))
+# Directory the app may read server-side files from. Unset (the default)
+# disables reading files by server path from the browser.
+SERVER_DATA_ROOT = os.environ.get('REVIFY_SERVER_DATA_ROOT')
+
+
+# Resolve a path entered in the app against SERVER_DATA_ROOT. Raises when
+# server paths are disabled or the path leads outside the root, e.g.
+# through '..' or a symlink.
+def server_path(path):
+    if not SERVER_DATA_ROOT:
+        raise ValueError("Reading server paths is disabled; set REVIFY_SERVER_DATA_ROOT to allow it")
+    root = os.path.realpath(SERVER_DATA_ROOT)
+    resolved = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, resolved]) != root:
+        raise ValueError(f"'{path}' is outside the server data directory")
+    return resolved
+
+
+# Arrow schema used when writing chunks, fixed from the first chunk so that
+# later chunks with other category sets or integer widths still fit
+def _chunk_schema(chunk):
+    schema = pa.Schema.from_pandas(chunk, preserve_index=False)
+    for i, field in enumerate(schema):
+        if field.name in CATEGORY_COLUMNS:
+            schema = schema.set(i, pa.field(field.name, pa.dictionary(pa.int32(), pa.string())))
+        elif field.name in INTEGER_COLUMNS:
+            schema = schema.set(i, pa.field(field.name, pa.int64()))
+    return schema
+
+
+# Read a sales CSV in bounded chunks, writing the rows to the Parquet cache
+# and folding each chunk into the aggregate cube as it goes. progress is
+# called with the fraction of the input consumed so far. Returns the cube
+# and the path of the cached Parquet file.
+def stream_sales_csv(file, progress=None, cache_dir=CACHE_DIR, chunk_rows=STREAM_CHUNK_ROWS):
+    key = file_key(file, cache_dir)
+    path = os.path.join(cache_dir, f"{key}.parquet")
+
+    if os.path.exists(path):
+        try:
+            cube = _cube_from_parquet(path, progress, chunk_rows)
+            os.utime(path)
+            return cube, path
+        except Exception:
+            pass
+
+    handle = open(file, 'rb') if isinstance(file, (str, os.PathLike)) else file
+    total_bytes = _file_size(handle)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    writer = None
+    merger = CubeMerger()
+    try:
+        for chunk in pd.read_csv(handle, dtype=CSV_DTYPES, chunksize=chunk_rows):
+            chunk = optimize_dtypes(chunk)
+            if writer is None:
+                schema = _chunk_schema(chunk)
+                writer = pq.ParquetWriter(tmp_path, schema)
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+            merger.add(build_cube(chunk))
+            if progress is not None and total_bytes:
+                progress(min(handle.tell() / total_bytes, 1.0))
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    finally:
+        if writer is not None:
+            writer.close()
+        if handle is not file:
+            handle.close()
+
+    cube = merger.result()
+    if cube is None:
+        raise ValueError("The file contains no rows")
+
+    os.replace(tmp_path, path)
+    evict_cache(cache_dir, keep=path)
+    if progress is not None:
+        progress(1.0)
+    return cube, path
+
+
+# Size in bytes of an open file or in-memory upload, if it can be told
+def _file_size(handle):
+    try:
+        return os.fstat(handle.fileno()).st_size
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return getattr(handle, 'size', None)
+
+
+# Rebuild the cube from an already cached Parquet file, batch by batch
+def _cube_from_parquet(path, progress, chunk_rows):
+    parquet = pq.ParquetFile(path)
+    total_rows = parquet.metadata.num_rows
+    done = 0
+    merger = CubeMerger()
+    for batch in parquet.iter_batches(batch_size=chunk_rows):
+        merger.add(build_cube(batch.to_pandas()))
+        done += batch.num_rows
+        if progress is not None and total_rows:
+            progress(done / total_rows)
+    return merger.result()
@@ -0,0 +1,145 @@
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from functools import wraps
+
+import numpy as np
+
+# Span durations kept per section for the percentiles
+TIMING_HISTORY = int(os.environ.get('REVIFY_TIMING_HISTORY', 200))
+
+# Every finished span is logged here as one JSON record. Set
+# REVIFY_TIMING_LOG to a file path, or to '-' for stderr, to write the
+# records out without configuring logging in the host process.
+logger = logging.getLogger('revify.timing')
+TIMING_LOG = os.environ.get('REVIFY_TIMING_LOG')
+if TIMING_LOG and not logger.handlers:
+    _handler = logging.StreamHandler() if TIMING_LOG == '-' else logging.FileHandler(TIMING_LOG)
+    _handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+
+
+# Timing and allocation spans around dashboard sections, shared by every
+# session in the process. Spans nest per thread; allocation peaks are only
+# measured while memory tracking is on, since tracing slows allocations.
+# The traced peak is process-wide, so a span that overlapped another
+# thread's spans records no peak.
+class SpanRecorder:
+    def __init__(self, history=TIMING_HISTORY):
+        self.history = history
+        self._seconds = defaultdict(lambda: deque(maxlen=self.history))
+        self._last = {}
+        self._peaks = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # Threads inside a span, and a counter bumped whenever one enters
+        # while another is already inside
+        self._active = 0
+        self._overlaps = 0
+
+    @property
+    def tracking_memory(self):
+        return tracemalloc.is_tracing()
+
+    # Turn allocation tracking on or off for the whole process
+    def track_memory(self, enabled):
+        if enabled and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        elif not enabled and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    # Time the enclosed block as a named section
+    @contextmanager
+    def span(self, section):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        if not stack:
+            with self._lock:
+                if self._active:
+                    self._overlaps += 1
+                self._active += 1
+        overlaps = self._overlaps
+        tracing = tracemalloc.is_tracing() and self._active == 1
+        if tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            # The enclosing span keeps the peak reached so far before this
+            # span resets it
+            if stack:
+                stack[-1]['peak'] = max(stack[-1]['peak'], peak)
+            tracemalloc.reset_peak()
+        frame = {'start_bytes': current if tracing else 0, 'peak': 0}
+        stack.append(frame)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - started
+            stack.pop()
+            if not stack:
+                with self._lock:
+                    self._active -= 1
+            alloc = None
+            if tracing and tracemalloc.is_tracing() and self._overlaps == overlaps:
+                peak = max(frame['peak'], tracemalloc.get_traced_memory()[1])
+                alloc = max(peak - frame['start_bytes'], 0)
+                if stack:
+                    stack[-1]['peak'] = max(stack[-1]['peak'], peak)
+            self._record(section, seconds, alloc, depth=len(stack))
+
+    # Decorator form of span
+    def timed(self, section):
+        def decorate(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.span(section):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def _record(self, section, seconds, alloc, depth):
+        record = {
+            'section': section,
+            'seconds': round(seconds, 6),
+            'peak_alloc_bytes': alloc,
+            'depth': depth,
+            'thread': threading.current_thread().name,
+            'ts': time.time(),
+        }
+        with self._lock:
+            self._seconds[section].append(seconds)
+            self._last[section] = record
+            if alloc is not None:
+                self._peaks[section] = alloc
+        logger.info(json.dumps(record))
+
+    # Per-section summary over the recent history: count, last duration,
+    # p50 and p95 in seconds and the last allocation peak measured without
+    # other threads' spans running
+    def stats(self):
+        with self._lock:
+            sections = {name: (list(values), self._last[name]) for name, values in self._seconds.items()}
+        rows = []
+        for name, (values, last) in sections.items():
+            p50, p95 = np.percentile(values, [50, 95])
+            rows.append({
+                'section': name,
+                'runs': len(values),
+                'last_s': last['seconds'],
+                'p50_s': float(p50),
+                'p95_s': float(p95),
+                'peak_alloc_bytes': self._peaks.get(name),
+            })
+        return sorted(rows, key=lambda row: row['p95_s'], reverse=True)
+
+    def clear(self):
+        with self._lock:
+            self._seconds.clear()
+            self._last.clear()
+            self._peaks.clear()
@@ -0,0 +1,44 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# Aggregations over at least this many rows are split into partitions and
+# computed in parallel
+PARALLEL_MIN_ROWS = int(os.environ.get('REVIFY_PARALLEL_MIN_ROWS', 1_000_000))
+PARALLEL_WORKERS = int(os.environ.get('REVIFY_PARALLEL_WORKERS', os.cpu_count() or 1))
+
+# One pool for the process; partitions are slices of frames already in
+# memory, so threads share them without copying
+_pool = None
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=PARALLEL_WORKERS, thread_name_prefix='revify-partition')
+    return _pool
+
+
+# Whether an aggregation over n_rows should run partitioned
+def use_partitions(n_rows):
+    return PARALLEL_WORKERS > 1 and n_rows >= PARALLEL_MIN_ROWS
+
+
+# (start, stop) bounds of n_parts contiguous, roughly equal row partitions.
+# With sorted day values the cuts are moved back to the start of the day
+# they fall in, so no day is split across two partitions.
+def row_partitions(n_rows, n_parts, days=None):
+    cuts = np.linspace(0, n_rows, n_parts + 1).astype(np.int64)
+    if days is not None:
+        inner = cuts[1:-1]
+        cuts[1:-1] = np.searchsorted(days, days[inner].astype('datetime64[D]'), side='left')
+    cuts = np.unique(cuts)
+    return list(zip(cuts[:-1].tolist(), cuts[1:].tolist()))
+
+
+# Apply fn to each row partition of a frame on the thread pool and return
+# the partial results in partition order
+def map_partitions(frame, fn, days=None):
+    bounds = row_partitions(len(frame), PARALLEL_WORKERS, days)
+    return list(_get_pool().map(lambda b: fn(frame.iloc[b[0]:b[1]]), bounds))
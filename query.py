@@ -0,0 +1,252 @@
+import os
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from ingest import load_cached_csv, optimize_dtypes, sort_by_date, conform_rows, append_rows, CATEGORY_COLUMNS, DATE_COLUMN
+from cube import build_cube, append_cube
+from filter_index import build_filter_index, extend_filter_index, filter_mask, date_window
+from result_cache import ResultCache
+
+# Column names of older exports and the names the dashboard uses for them
+LEGACY_COLUMNS = {
+    'gender': 'Gender',
+    'age': 'Age',
+    'units_sold': 'UnitsSold',
+    'price': 'Price',
+    'item_type': 'ItemType',
+    'city': 'City',
+    'discount_applied': 'Discount',
+    'return_status': 'Return',
+    'date_of_purchase': 'Date',
+    'payment_method': 'Payment',
+    'profit': 'Profit',
+}
+LEGACY_DATE_FORMAT = '%d-%m-%Y'
+
+# Memory budget for the row positions remembered per engine
+QUERY_CACHE_MAX_BYTES = 64 * 1024 ** 2
+
+
+# Bring a loaded sales frame to the dashboard schema: legacy column names
+# are renamed, legacy day-first dates parsed, dtypes compacted and rows
+# sorted by date
+def normalize_sales_frame(df):
+    legacy = {old: new for old, new in LEGACY_COLUMNS.items() if old in df.columns and new not in df.columns}
+    if legacy:
+        df = df.rename(columns=legacy)
+        if 'date_of_purchase' in legacy and not pd.api.types.is_datetime64_any_dtype(df[DATE_COLUMN]):
+            df[DATE_COLUMN] = pd.to_datetime(df[DATE_COLUMN], format=LEGACY_DATE_FORMAT, errors='coerce')
+    return sort_by_date(optimize_dtypes(df))
+
+
+# (low, high) bounds of a range spec. A scalar matches one value and
+# either bound may be None for an open range.
+def _as_range(spec):
+    if isinstance(spec, (tuple, list)) and len(spec) == 2:
+        return spec[0], spec[1]
+    return spec, spec
+
+
+# Hashable key for a filter spec
+def _spec_key(filters):
+    def freeze(spec):
+        if isinstance(spec, (list, tuple, set, frozenset)):
+            return tuple(str(v) for v in spec) if isinstance(spec, tuple) else tuple(sorted(str(v) for v in spec))
+        return str(spec)
+    return tuple(sorted((col, freeze(spec)) for col, spec in filters.items()))
+
+
+# Answers filtered queries against one dataset. The data is loaded,
+# typed and indexed once; every query after that is a pass over the
+# filter index and the matching row positions are cached.
+#
+# A filter spec maps a column to what it must match:
+#   - category columns: one value or a list of values
+#   - numeric columns: a value or an inclusive (low, high) pair
+#   - Date: a date or an inclusive (start, end) pair of dates
+# Either end of a pair may be None to leave that side open.
+class QueryEngine:
+    def __init__(self, df):
+        # Dashboard names of the legacy columns the data was loaded with
+        self.legacy_columns = {
+            new: old for old, new in LEGACY_COLUMNS.items() if old in df.columns and new not in df.columns
+        }
+        self.df = normalize_sales_frame(df)
+        self.index = build_filter_index(self.df)
+        self._positions = ResultCache(max_bytes=QUERY_CACHE_MAX_BYTES)
+        self._cube = None
+
+    # Engine for a CSV file, read through the Parquet cache
+    @classmethod
+    def from_file(cls, file_path):
+        return cls(load_cached_csv(file_path))
+
+    # Aggregate cube of the whole dataset, built on first use
+    @property
+    def cube(self):
+        if self._cube is None:
+            self._cube = build_cube(self.df)
+        return self._cube
+
+    # Add new rows, e.g. the latest day's sales. The filter index and cube
+    # are extended with the new rows instead of being rebuilt; remembered
+    # filter results are dropped.
+    def append(self, rows):
+        rows = conform_rows(normalize_sales_frame(rows), self.df.columns)
+        df, in_order = append_rows(self.df, rows)
+        self.index = extend_filter_index(self.index, df) if in_order else build_filter_index(df)
+        if self._cube is not None:
+            self._cube = append_cube(self._cube, build_cube(rows))
+        self.df = df
+        self._positions.clear()
+
+    # Row positions matching a filter spec, in date order
+    def positions(self, filters=None):
+        filters = filters or {}
+        return self._positions.get_or_compute(_spec_key(filters), lambda: self._match(filters))
+
+    # Rows matching a filter spec
+    def query(self, filters=None, columns=None):
+        rows = self.df.iloc[self.positions(filters)]
+        return rows if columns is None else rows[columns]
+
+    # Sum of a column over the rows matching a filter spec
+    def total(self, filters=None, column='Profit'):
+        values = self.df[column].to_numpy(dtype='float64', na_value=np.nan)[self.positions(filters)]
+        return float(np.nansum(values))
+
+    def _match(self, filters):
+        selections = {}
+        ranges = {}
+        other_ranges = {}
+        date_range = None
+        for col, spec in filters.items():
+            if col not in self.df.columns:
+                raise KeyError(f"Unknown column: {col}")
+            if col == DATE_COLUMN:
+                date_range = _as_range(spec)
+            elif col in CATEGORY_COLUMNS:
+                selections[col] = list(spec) if isinstance(spec, (list, tuple, set, frozenset)) else [spec]
+            else:
+                lo, hi = _as_range(spec)
+                bounds = (-np.inf if lo is None else float(lo), np.inf if hi is None else float(hi))
+                if col in self.index['sorted']:
+                    ranges[col] = bounds
+                else:
+                    other_ranges[col] = bounds
+
+        dates = self.df[DATE_COLUMN] if date_range is not None else None
+        window = None
+        if date_range is not None:
+            date_range = (
+                dates.min() if date_range[0] is None else pd.Timestamp(date_range[0]),
+                dates.max() if date_range[1] is None else pd.Timestamp(date_range[1])
+            )
+            window = date_window(self.index, date_range)
+
+        mask = filter_mask(self.index, selections, ranges, window)
+        start, stop = window if window is not None else (0, len(self.df))
+
+        # Without a date-sorted index the date range is compared row by row
+        if date_range is not None and window is None:
+            mask &= (
+                (dates >= date_range[0]) &
+                (dates < date_range[1] + pd.Timedelta(days=1))
+            ).to_numpy()
+
+        for col, (lo, hi) in other_ranges.items():
+            values = self.df[col].to_numpy(dtype='float64', na_value=np.nan)[start:stop]
+            mask &= (values >= lo) & (values <= hi)
+
+        return start + np.flatnonzero(mask)
+
+
+# Engines by file, reused while the file is unchanged
+@lru_cache(maxsize=8)
+def _engine_for(path, mtime, size):
+    return QueryEngine.from_file(path)
+
+
+def get_engine(file_path):
+    stat = os.stat(file_path)
+    return _engine_for(os.path.abspath(file_path), stat.st_mtime, stat.st_size)
+
+
+# Parse a "low-high" range string such as "20-30"
+def _parse_range(text):
+    lo, hi = map(float, text.split('-'))
+    return lo, hi
+
+
+# Parse a "DD-MM-YYYY" date or a "DD-MM-YYYY to DD-MM-YYYY" range
+def _parse_date_range(text):
+    if ' to ' in text:
+        start, end = text.split(' to ')
+        return (
+            pd.to_datetime(start, format=LEGACY_DATE_FORMAT),
+            pd.to_datetime(end, format=LEGACY_DATE_FORMAT)
+        )
+    day = pd.to_datetime(text, format=LEGACY_DATE_FORMAT)
+    return day, day
+
+
+# Filter a sales CSV by the given criteria. Ranges are "low-high" strings
+# and dates "DD-MM-YYYY" or "DD-MM-YYYY to DD-MM-YYYY". The file is loaded
+# once per process and later calls only run the query; for structured
+# specs use get_engine(file_path).query(...) directly.
+def getFilteredData(
+    file_path,
+    gender=None,
+    age=None,
+    units_sold=None,
+    price=None,
+    item_type=None,
+    city=None,
+    discount_applied=None,
+    return_status=None,
+    date_of_purchase=None,
+    payment_method=None
+):
+    try:
+        engine = get_engine(file_path)
+    except FileNotFoundError:
+        print(f"Error: File '{file_path}' not found.")
+        return None
+    except Exception as e:
+        print(f"Error reading the CSV file: {e}")
+        return None
+
+    filters = {}
+    for col, value in [
+        ('Gender', gender),
+        ('ItemType', item_type),
+        ('City', city),
+        ('Discount', discount_applied),
+        ('Return', return_status),
+        ('Payment', payment_method)
+    ]:
+        if value is not None:
+            filters[col] = value
+
+    for col, value, label in [
+        ('Age', age, 'age range'),
+        ('UnitsSold', units_sold, 'units sold range'),
+        ('Price', price, 'price range')
+    ]:
+        if value is None:
+            continue
+        try:
+            filters[col] = _parse_range(value)
+        except Exception as e:
+            print(f"Invalid {label}: {value}. Error: {e}")
+
+    if date_of_purchase is not None:
+        try:
+            filters[DATE_COLUMN] = _parse_date_range(date_of_purchase)
+        except Exception as e:
+            print(f"Invalid date range: {date_of_purchase}. Error: {e}")
+
+    # Rows come back under the column names the file uses
+    return engine.query(filters).rename(columns=engine.legacy_columns)
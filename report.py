@@ -0,0 +1,241 @@
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from cube import build_cube, rollup, totals, share
+from forecasting import forecast_series, batch_forecast
+from query import get_engine
+
+# Dimensions broken down in every report, as on the dashboard
+BREAKDOWN_DIMENSIONS = ['City', 'ItemType', 'Gender', 'Payment', 'AgeGroup', 'Return', 'Discount']
+FORECAST_METRICS = ['Price', 'UnitsSold', 'Profit']
+REPORT_FORMATS = ['json', 'parquet']
+
+
+# Plain Python value for a metric, with NaN as None so it is valid JSON
+def _scalar(value):
+    if isinstance(value, (np.generic,)):
+        value = value.item()
+    if isinstance(value, float) and np.isnan(value):
+        return None
+    return value
+
+
+# Key metric cards and Overview Metrics for a filtered cube, compared with
+# the whole dataset the same way the dashboard does
+def summary_metrics(cube, overall_cube):
+    current = totals(cube)
+    overall = totals(overall_cube)
+    payment_total = rollup(cube, 'Payment').set_index('Payment')['Price']
+    metrics = {
+        'rows': int(current['Count']),
+        'total_sales': current['Price_sum'],
+        'total_profit': current['Profit_sum'],
+        'units_sold': current['UnitsSold_sum'],
+        'average_feedback': current['Feedback_mean'],
+        'average_order_value': current['Price_mean'],
+        'return_rate': share(cube, 'Return', 'Returned'),
+        'discount_rate': share(cube, 'Discount', 'Yes'),
+        'top_payment_method': payment_total.idxmax() if len(payment_total) else None,
+        'top_payment_sales': payment_total.max() if len(payment_total) else None,
+        'total_sales_change_pct': (current['Price_sum'] / overall['Price_sum'] - 1) * 100,
+        'total_profit_change_pct': (current['Profit_sum'] / overall['Profit_sum'] - 1) * 100,
+        'units_sold_change_pct': (current['UnitsSold_sum'] / overall['UnitsSold_sum'] - 1) * 100,
+        'average_feedback_change_pct': (current['Feedback_mean'] / overall['Feedback_mean'] - 1) * 100,
+    }
+    return {name: _scalar(value) for name, value in metrics.items()}
+
+
+# Product Metrics table: sums and means per item type
+def product_metrics(cube):
+    sums = rollup(cube, 'ItemType', ('Price', 'UnitsSold', 'Profit'), 'sum').set_index('ItemType')
+    means = rollup(cube, 'ItemType', ('Price', 'UnitsSold', 'Profit', 'Feedback'), 'mean').set_index('ItemType')
+    return pd.DataFrame({
+        'Price_sum': sums['Price'],
+        'Price_mean': means['Price'],
+        'UnitsSold_sum': sums['UnitsSold'],
+        'UnitsSold_mean': means['UnitsSold'],
+        'Profit_sum': sums['Profit'],
+        'Profit_mean': means['Profit'],
+        'Feedback_mean': means['Feedback']
+    }).round(2).reset_index()
+
+
+# Daily forecasts of the dashboard metrics, one column per metric
+def metric_forecasts(cube, days_to_forecast):
+    forecast = None
+    for metric in FORECAST_METRICS:
+        future_dates, predictions = forecast_series(rollup(cube, 'Date', (metric,)), days_to_forecast, metric)
+        if forecast is None:
+            forecast = pd.DataFrame({'Date': future_dates})
+        forecast[f"Forecast {metric}"] = predictions
+    return forecast
+
+
+# Every table and metric of one report
+def build_report(engine, filters, days_to_forecast=30):
+    overall_cube = engine.cube
+    rows = engine.query(filters)
+    if not len(rows):
+        return {'metrics': {'rows': 0}, 'tables': {}}
+
+    cube = build_cube(rows) if filters else overall_cube
+    tables = {
+        f"by_{dim.lower()}": rollup(cube, dim, ('Price', 'UnitsSold', 'Profit'))
+        for dim in BREAKDOWN_DIMENSIONS
+    }
+    tables['product_metrics'] = product_metrics(cube)
+    tables['daily'] = rollup(cube, 'Date', ('Price', 'UnitsSold', 'Profit'))
+    if len(tables['daily']) > 1:
+        tables['forecast'] = metric_forecasts(cube, days_to_forecast)
+        tables['replenishment_forecast'] = batch_forecast(cube, days_to_forecast, 'Price')
+    return {'metrics': summary_metrics(cube, overall_cube), 'tables': tables}
+
+
+# File-system friendly name for a report directory
+def _slug(text):
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', str(text)).strip('_') or 'report'
+
+
+# Write a report as report.json and/or one Parquet file per table
+def write_report(report, out_dir, formats=REPORT_FORMATS):
+    os.makedirs(out_dir, exist_ok=True)
+    if 'json' in formats:
+        payload = {
+            'metrics': report['metrics'],
+            'tables': {
+                name: json.loads(table.to_json(orient='records', date_format='iso'))
+                for name, table in report['tables'].items()
+            }
+        }
+        with open(os.path.join(out_dir, 'report.json'), 'w') as handle:
+            json.dump(payload, handle, indent=2, default=str)
+    if 'parquet' in formats:
+        for name, table in report['tables'].items():
+            table.to_parquet(os.path.join(out_dir, f"{name}.parquet"), index=False)
+
+
+# Worker entry point: one report for one file and one filter preset. The
+# engine is cached per process, so a worker that gets several presets of
+# the same file loads it once.
+def run_task(file_path, preset_name, filters, out_dir, days_to_forecast, formats):
+    started = time.perf_counter()
+    try:
+        report = build_report(get_engine(file_path), filters, days_to_forecast)
+        write_report(report, out_dir, formats)
+        return {
+            'file': file_path,
+            'preset': preset_name,
+            'output': out_dir,
+            'rows': report['metrics']['rows'],
+            'seconds': round(time.perf_counter() - started, 3),
+        }
+    except Exception as e:
+        return {'file': file_path, 'preset': preset_name, 'output': out_dir, 'error': f"{type(e).__name__}: {e}"}
+
+
+# Report directory name of every file: the file name, or where two files
+# share a name, the path from their common parent directory. Raises when
+# two files would still write to the same directory.
+def report_names(files):
+    names = [_slug(os.path.splitext(os.path.basename(path))[0]) for path in files]
+    if len(set(names)) < len(names):
+        paths = [os.path.splitext(os.path.abspath(path))[0] for path in files]
+        root = os.path.commonpath([os.path.dirname(path) for path in paths])
+        names = [
+            os.path.join(*(_slug(part) for part in os.path.relpath(path, root).split(os.sep)))
+            for path in paths
+        ]
+    seen = {}
+    for path, name in zip(files, names):
+        if name in seen:
+            raise ValueError(f"Reports for '{seen[name]}' and '{path}' would both be written to '{name}'")
+        seen[name] = path
+    return names
+
+
+# Sales files named on the command line; directories contribute every CSV
+# directly inside them
+def collect_files(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(
+                os.path.join(path, name) for name in sorted(os.listdir(path))
+                if name.lower().endswith('.csv')
+            )
+        else:
+            files.append(path)
+    return files
+
+
+# Filter presets from a JSON file mapping a preset name to a filter spec
+# (see QueryEngine); without one each file gets a single unfiltered report
+def load_presets(path):
+    if path is None:
+        return {'all': {}}
+    with open(path) as handle:
+        return json.load(handle)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compute Revify dashboard reports for many sales files without a browser.")
+    parser.add_argument('inputs', nargs='+', help="sales CSV files or directories of them")
+    parser.add_argument('--presets', help="JSON file mapping preset names to filter specs")
+    parser.add_argument('--output', default='reports', help="directory the reports are written to")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="worker processes (default: one per core)")
+    parser.add_argument('--forecast-days', type=int, default=30, help="days to forecast")
+    parser.add_argument('--format', choices=REPORT_FORMATS + ['both'], default='both', help="output format")
+    args = parser.parse_args(argv)
+
+    files = collect_files(args.inputs)
+    if not files:
+        print("Error: no sales files found.")
+        return 1
+    try:
+        names = report_names(files)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return 1
+    presets = load_presets(args.presets)
+    formats = REPORT_FORMATS if args.format == 'both' else [args.format]
+
+    # Tasks are ordered file by file so the presets of one file tend to
+    # land on workers that already hold it
+    tasks = [
+        (path, name, filters, os.path.join(args.output, file_name, _slug(name)))
+        for path, file_name in zip(files, names)
+        for name, filters in presets.items()
+    ]
+
+    started = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        futures = [pool.submit(run_task, *task, args.forecast_days, formats) for task in tasks]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            if 'error' in result:
+                print(f"Error in {result['file']} [{result['preset']}]: {result['error']}")
+            else:
+                print(f"{result['file']} [{result['preset']}]: {result['rows']:,} rows in {result['seconds']:.2f}s")
+
+    os.makedirs(args.output, exist_ok=True)
+    results.sort(key=lambda r: (r['file'], r['preset']))
+    with open(os.path.join(args.output, 'index.json'), 'w') as handle:
+        json.dump(results, handle, indent=2, default=str)
+
+    failed = sum('error' in r for r in results)
+    print(f"{len(results) - failed} of {len(results)} reports written to {args.output} in {time.perf_counter() - started:.1f}s")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,97 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# Memory budget for cached dashboard results
+RESULT_CACHE_MAX_BYTES = int(os.environ.get('REVIFY_RESULT_CACHE_MAX_BYTES', 256 * 1024 ** 2))
+
+
+# Approximate memory held by a cached result
+def sizeof(value):
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, (pd.Series, pd.Index)):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(sizeof(v) for v in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(sizeof(k) + sizeof(v) for k, v in value.items())
+    return sys.getsizeof(value)
+
+
+# Bounded least-recently-used cache for computed results, shared by every
+# session in the process. Results must be treated as read-only by callers.
+class ResultCache:
+    def __init__(self, max_bytes=RESULT_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    # Return the cached result for key, computing and storing it on a miss
+    def get_or_compute(self, key, compute):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            self.misses += 1
+
+        value = compute()
+        size = sizeof(value)
+        if size > self.max_bytes:
+            return value
+
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+
+# Hashable, order-independent key for a filter state. Category selections
+# are compared as sets and float ranges are rounded so slider noise does
+# not create distinct entries.
+def filter_key(date_range, selections, price_range=None, age_range=None):
+    return (
+        tuple(str(d) for d in date_range),
+        tuple(sorted(
+            (col, tuple(sorted(str(v) for v in values)))
+            for col, values in selections.items()
+            if values is not None
+        )),
+        None if price_range is None else tuple(round(float(p), 2) for p in price_range),
+        None if age_range is None else tuple(int(a) for a in age_range),
+    )
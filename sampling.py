@@ -0,0 +1,191 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from cube import build_cube, CUBE_MEASURES
+from filter_index import build_filter_index
+from backends import PandasBackend
+from result_cache import sizeof
+
+# Datasets with at least this many rows offer approximate results
+APPROX_MIN_ROWS = int(os.environ.get('REVIFY_APPROX_MIN_ROWS', 2_000_000))
+# Target size of the stratified sample behind approximate results
+SAMPLE_ROWS = int(os.environ.get('REVIFY_SAMPLE_ROWS', 100_000))
+# Columns whose value combinations form the sampling strata
+SAMPLE_STRATA = ['City', 'ItemType']
+# Every stratum is sampled at least this often (or entirely when smaller)
+MIN_STRATUM_ROWS = 30
+# Threads computing exact results behind approximate ones
+REFINE_WORKERS = int(os.environ.get('REVIFY_REFINE_WORKERS', 2))
+# Seconds between checks whether exact results are ready
+REFINE_POLL_SECONDS = 0.5
+# Memory budget for finished refinements waiting for sessions to pick
+# them up. The newest result is kept even when it alone is larger.
+REFINE_MAX_BYTES = int(os.environ.get('REVIFY_REFINE_MAX_BYTES', 1024 ** 3))
+# Refinements remembered at most, finished or not
+REFINE_HISTORY = 256
+# z-score of the reported confidence intervals (95%)
+CONFIDENCE_Z = 1.96
+
+
+# Stratum number of every row: one per combination of the strata columns'
+# values, missing values included
+def stratum_ids(df, strata=SAMPLE_STRATA):
+    ids = np.zeros(len(df), dtype=np.int64)
+    for col in strata:
+        values = df[col]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            codes, n_values = values.cat.codes.to_numpy(), len(values.cat.categories)
+        else:
+            codes, uniques = pd.factorize(values)
+            n_values = len(uniques)
+        ids = ids * (n_values + 1) + (codes.astype(np.int64) + 1)
+    return ids
+
+
+# Stratified random sample of a dataset. Each stratum is sampled in
+# proportion to its size, small strata at least MIN_STRATUM_ROWS times, and
+# every sampled row is weighted by the number of rows it stands for. The
+# sample has its own filter index, so filters are answered from it the
+# same way as from the full data.
+class StratifiedSample:
+    def __init__(self, df, size=SAMPLE_ROWS, strata=SAMPLE_STRATA, seed=0):
+        ids = stratum_ids(df, [col for col in strata if col in df.columns])
+        population = np.bincount(ids).astype('float64')
+        with np.errstate(divide='ignore', invalid='ignore'):
+            target = np.maximum(size * population / max(len(df), 1), np.minimum(MIN_STRATUM_ROWS, population))
+            rate = np.where(population > 0, np.minimum(target / population, 1.0), 0.0)
+
+        rng = np.random.default_rng(seed)
+        self.positions = np.flatnonzero(rng.random(len(df)) < rate[ids])
+        self.data = df.iloc[self.positions].reset_index(drop=True)
+        self.strata = ids[self.positions]
+        self.population = population
+        self.sizes = np.bincount(self.strata, minlength=len(population)).astype('float64')
+        self.weights = (population / np.maximum(self.sizes, 1))[self.strata]
+        self.n_rows = len(df)
+        self.filter_index = build_filter_index(self.data)
+
+    @property
+    def nbytes(self):
+        return int(self.data.memory_usage(deep=True).sum()) + self.weights.nbytes + self.strata.nbytes
+
+    # Estimated cube of the rows matching the filters, with 95% confidence
+    # margins for the totals and means of every measure and for the share
+    # of rows with each (column, value) in shares
+    def estimate(self, date_range, selections, ranges, shares=()):
+        positions = PandasBackend(self).row_positions(date_range, selections, ranges)
+        cube = build_cube(self.data.iloc[positions], weights=self.weights[positions])
+        return cube, self.margins(positions, shares)
+
+    # Confidence margins for the matching sample rows. Totals use the
+    # stratified estimator's variance; means and shares are ratios of two
+    # totals and use its linearized variance.
+    def margins(self, positions, shares=()):
+        strata = self.strata[positions]
+        weights = self.weights[positions]
+        count = weights.sum()
+        rows = self.data.iloc[positions]
+
+        result = {}
+        for m in CUBE_MEASURES:
+            raw = rows[m].to_numpy(dtype='float64', na_value=np.nan)
+            present = ~np.isnan(raw)
+            values = np.nan_to_num(raw)
+            result[f"{m}_sum"] = CONFIDENCE_Z * np.sqrt(self._variance(strata, values))
+            # Means are over the rows that have a value
+            m_count = weights[present].sum()
+            if m_count:
+                mean = (weights * values).sum() / m_count
+                result[f"{m}_mean"] = CONFIDENCE_Z * np.sqrt(self._variance(strata, np.where(present, values - mean, 0.0))) / m_count
+        for col, value in shares:
+            matches = (rows[col] == value).to_numpy(dtype='float64', na_value=0.0)
+            if count:
+                rate = (weights * matches).sum() / count
+                result[(col, value)] = 100 * CONFIDENCE_Z * np.sqrt(self._variance(strata, matches - rate)) / count
+        return result
+
+    # Variance of the estimated total of values, which are given for the
+    # matching sample rows and count as zero for every other sampled row
+    def _variance(self, strata, values):
+        n = self.sizes
+        big_n = self.population
+        s1 = np.bincount(strata, weights=values, minlength=len(n))
+        s2 = np.bincount(strata, weights=values * values, minlength=len(n))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            spread = np.where(n > 1, (s2 - s1 * s1 / n) / (n - 1), 0.0)
+            variance = np.where(n > 0, big_n * big_n * (1 - n / big_n) * spread / n, 0.0)
+        return float(np.maximum(variance, 0).sum())
+
+
+# Background computation of exact results behind approximate ones. Each
+# result is computed once per key and kept with its task until newer
+# results push it over the memory budget; work queued for a filter state a
+# session has already moved away from is dropped.
+class Refiner:
+    def __init__(self, workers=REFINE_WORKERS, max_bytes=REFINE_MAX_BYTES, history=REFINE_HISTORY):
+        self.max_bytes = max_bytes
+        self.history = history
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='revify-refine')
+        self._futures = OrderedDict()
+        # Memory held by each finished result
+        self._sizes = {}
+        # Reentrant: a task that finishes at once runs its callback in submit
+        self._lock = threading.RLock()
+
+    # Start compute for key in the background unless it is already queued,
+    # running or done
+    def submit(self, key, compute, owner=None):
+        with self._lock:
+            for other, (future, other_owner) in self._futures.items():
+                if other != key and owner is not None and other_owner == owner:
+                    future.cancel()
+            entry = self._futures.get(key)
+            if entry is None or entry[0].cancelled():
+                future = self._executor.submit(compute)
+                self._futures[key] = (future, owner)
+                future.add_done_callback(lambda future, key=key: self._finished(key, future))
+            self._futures.move_to_end(key)
+            self._trim()
+
+    # Record the size of a finished result and drop the oldest others over
+    # the budget
+    def _finished(self, key, future):
+        size = 0 if future.cancelled() or future.exception() is not None else sizeof(future.result())
+        with self._lock:
+            entry = self._futures.get(key)
+            if entry is None or entry[0] is not future:
+                return
+            self._sizes[key] = size
+            self._trim(keep=key)
+
+    # Forget finished refinements, oldest first, while over the memory
+    # budget or the history length
+    def _trim(self, keep=None):
+        total = sum(self._sizes.values())
+        for key in list(self._futures):
+            if total <= self.max_bytes and len(self._futures) <= self.history:
+                break
+            if key == keep or not self._futures[key][0].done():
+                continue
+            total -= self._sizes.pop(key, 0)
+            del self._futures[key]
+
+    # Whether the exact result for key has been computed (or failed)
+    def done(self, key):
+        with self._lock:
+            entry = self._futures.get(key)
+        return entry is not None and entry[0].done() and not entry[0].cancelled()
+
+    # Result computed for key, or None when it is not ready or no longer
+    # kept. Raises the computation's error when it failed.
+    def result(self, key):
+        if not self.done(key):
+            return None
+        with self._lock:
+            entry = self._futures.get(key)
+        return entry[0].result() if entry is not None else None
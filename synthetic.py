@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+
+from ingest import DATE_FORMAT
+
+# Category values and how often they occur. Weights are deliberately
+# skewed so a few values dominate, as in real store data.
+CITIES = ['Mumbai', 'Delhi', 'Bengaluru', 'Hyderabad', 'Chennai', 'Kolkata', 'Pune', 'Ahmedabad', 'Jaipur', 'Lucknow']
+CITY_WEIGHTS = 1 / np.arange(1, len(CITIES) + 1) ** 1.1
+ITEM_TYPES = ['Electronics', 'Clothing', 'Groceries', 'Books', 'Toys']
+ITEM_WEIGHTS = np.array([0.18, 0.30, 0.32, 0.12, 0.08])
+# Median price and profit margin per item type
+ITEM_PRICES = np.array([450.0, 60.0, 15.0, 25.0, 35.0])
+ITEM_MARGINS = np.array([0.12, 0.35, 0.08, 0.25, 0.30])
+PAYMENTS = ['UPI', 'Credit Card', 'Debit Card', 'Cash', 'Net Banking', 'Wallet']
+PAYMENT_WEIGHTS = np.array([0.38, 0.22, 0.16, 0.12, 0.07, 0.05])
+GENDERS = ['Female', 'Male']
+GENDER_WEIGHTS = np.array([0.52, 0.48])
+RETURN_RATE = 0.08
+DISCOUNT_RATE = 0.3
+
+# Columns in the order of a Revify sales export
+COLUMNS = ['City', 'Gender', 'Age', 'ItemType', 'Price', 'UnitsSold', 'Profit', 'Date', 'Feedback', 'Payment', 'Discount', 'Return']
+
+GENERATE_CHUNK_ROWS = 1_000_000
+
+
+def _normalized(weights):
+    weights = np.asarray(weights, dtype='float64')
+    return weights / weights.sum()
+
+
+# Sales per day: weekends are busier and volume grows through the period.
+# Returned as the cumulative row count at the end of each day.
+def _day_ends(n_rows, days, seed):
+    day = np.arange(days)
+    weights = (1 + 0.35 * (day % 7 >= 5)) * (1 + 0.5 * day / max(days - 1, 1))
+    counts = np.random.default_rng([seed, 0]).multinomial(n_rows, _normalized(weights))
+    return np.cumsum(counts)
+
+
+# Rows start:stop of a synthetic dataset, generated from their own seeded
+# stream so the output depends only on the seed and the chunk layout
+def _chunk(start, stop, day_ends, first_day, seed, chunk_index):
+    rng = np.random.default_rng([seed, chunk_index + 1])
+    n = stop - start
+    day = np.searchsorted(day_ends, np.arange(start, stop), side='right')
+
+    item = rng.choice(len(ITEM_TYPES), n, p=ITEM_WEIGHTS)
+    price = np.round(ITEM_PRICES[item] * rng.lognormal(0.0, 0.6, n), 2)
+    units = 1 + rng.poisson(2.0, n)
+    profit = np.round(price * units * ITEM_MARGINS[item] * rng.normal(1.0, 0.15, n), 2)
+
+    return pd.DataFrame({
+        'City': pd.Categorical.from_codes(rng.choice(len(CITIES), n, p=_normalized(CITY_WEIGHTS)), CITIES),
+        'Gender': pd.Categorical.from_codes(rng.choice(len(GENDERS), n, p=GENDER_WEIGHTS), GENDERS),
+        'Age': np.clip(np.round(rng.normal(36, 11, n)), 18, 75).astype(np.int8),
+        'ItemType': pd.Categorical.from_codes(item, ITEM_TYPES),
+        'Price': price,
+        'UnitsSold': units.astype(np.int16),
+        'Profit': profit,
+        'Date': first_day + pd.to_timedelta(day, unit='D'),
+        'Feedback': np.clip(np.round(rng.normal(3.8, 0.9, n), 1), 1.0, 5.0).astype(np.float32),
+        'Payment': pd.Categorical.from_codes(rng.choice(len(PAYMENTS), n, p=PAYMENT_WEIGHTS), PAYMENTS),
+        'Discount': pd.Categorical(np.where(rng.random(n) < DISCOUNT_RATE, 'Yes', 'No'), categories=['No', 'Yes']),
+        'Return': pd.Categorical(np.where(rng.random(n) < RETURN_RATE, 'Returned', 'Not Returned'), categories=['Not Returned', 'Returned']),
+    }, columns=COLUMNS)
+
+
+# Yield a deterministic synthetic sales dataset of n_rows in date order,
+# chunk_rows at a time, with many sales per day spread over the given days
+def generate_sales_chunks(n_rows, seed=0, days=365, start='2023-01-01', chunk_rows=GENERATE_CHUNK_ROWS):
+    day_ends = _day_ends(n_rows, days, seed)
+    first_day = pd.Timestamp(start)
+    for chunk_index, chunk_start in enumerate(range(0, n_rows, chunk_rows)):
+        yield _chunk(chunk_start, min(chunk_start + chunk_rows, n_rows), day_ends, first_day, seed, chunk_index)
+
+
+# A synthetic sales dataset held in memory
+def generate_sales(n_rows, seed=0, days=365, start='2023-01-01', chunk_rows=GENERATE_CHUNK_ROWS):
+    chunks = list(generate_sales_chunks(n_rows, seed, days, start, chunk_rows))
+    return pd.concat(chunks, ignore_index=True) if len(chunks) > 1 else chunks[0]
+
+
+# Write a synthetic sales CSV chunk by chunk, so datasets larger than
+# memory can be produced
+def write_sales_csv(path, n_rows, seed=0, days=365, start='2023-01-01', chunk_rows=GENERATE_CHUNK_ROWS):
+    with open(path, 'w', newline='') as handle:
+        for i, chunk in enumerate(generate_sales_chunks(n_rows, seed, days, start, chunk_rows)):
+            chunk.to_csv(handle, index=False, header=i == 0, date_format=DATE_FORMAT)
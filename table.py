@@ -0,0 +1,29 @@
+import numpy as np
+import pandas as pd
+
+# Rows per page offered by the Detailed Data table
+PAGE_SIZES = [25, 50, 100, 250, 500]
+
+
+# Stable sort order of a column over the whole dataset, missing values last
+# in both directions. Computed once per dataset and column.
+def sort_order(values, ascending=True):
+    codes, uniques = pd.factorize(values, sort=True)
+    if not ascending:
+        codes = np.where(codes < 0, -1, len(uniques) - 1 - codes)
+    codes = np.where(codes < 0, len(uniques), codes)
+    return np.argsort(codes, kind='stable')
+
+
+# Positions of the filtered rows in the order of a precomputed sort order.
+# Only positions are reordered; the frame itself is never copied or sorted.
+def sorted_positions(order, positions):
+    member = np.zeros(len(order), dtype=bool)
+    member[positions] = True
+    return order[member[order]]
+
+
+# Row positions shown on a page, pages counted from 1
+def page_positions(positions, page, page_size):
+    start = (page - 1) * page_size
+    return positions[start:start + page_size]
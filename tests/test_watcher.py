@@ -0,0 +1,55 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import watcher
+from datasets import DatasetRegistry
+from watcher import DirectoryWatcher
+
+HEADER = b"City,Gender,Age,ItemType,Price,UnitsSold,Profit,Date,Feedback,Payment,Discount,Return\n"
+
+
+def sales_row(day):
+    return f"Pune,Female,30,Books,100.0,2,20.0,2023-01-{day:02d},4.0,Cash,No,Not Returned\n".encode()
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    # Parsed files are cached relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(watcher, 'WATCH_SETTLE_SECONDS', 0)
+    path = tmp_path / 'drops'
+    path.mkdir()
+    return path
+
+
+def rows_loaded(watch):
+    return len(watch.open().dataset.data)
+
+
+# A row cut off mid-write is read once it is complete, and later rows are
+# appended after it instead of the whole file being ingested again
+def test_partial_row_is_not_ingested_twice(data_dir):
+    sales = data_dir / 'sales.csv'
+    rows = b''.join(sales_row(day) for day in range(1, 11))
+    row_11 = sales_row(11)
+    sales.write_bytes(HEADER + rows + row_11[:20])
+
+    watch = DirectoryWatcher(str(data_dir), DatasetRegistry()).start()
+    watch.stop()
+    assert rows_loaded(watch) == 10
+
+    with open(sales, 'ab') as handle:
+        handle.write(row_11[20:])
+    watch.scan()
+    assert rows_loaded(watch) == 11
+    assert watch.last_error is None
+
+    with open(sales, 'ab') as handle:
+        handle.write(sales_row(12))
+    watch.scan()
+    assert rows_loaded(watch) == 12
+
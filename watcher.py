@@ -0,0 +1,285 @@
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+import time
+
+import pandas as pd
+
+from ingest import load_cached_csv, read_sales_csv, optimize_dtypes, sort_by_date, conform_rows, combine_frames, file_key
+
+# Seconds between scans of a watched directory
+WATCH_INTERVAL = float(os.environ.get('REVIFY_WATCH_INTERVAL', 10))
+# Files modified more recently than this may still be being written; they
+# are picked up by a later scan
+WATCH_SETTLE_SECONDS = 2
+# Bytes before the read position of a CSV that are hashed to tell a file
+# that grew from one that was rewritten
+TAIL_CHECK_BYTES = 64 * 1024
+WATCH_SUFFIXES = ('.csv', '.parquet')
+
+logger = logging.getLogger('revify.watcher')
+
+
+# Watches a directory of sales CSV and Parquet drops and keeps a shared
+# dataset of all of them up to date. New files, and rows added to the end
+# of a CSV, are appended to the dataset; any other change (a rewritten,
+# shrunk or deleted file) rebuilds it from every file, reusing the parsed
+# copies of unchanged files from the on-disk cache.
+class DirectoryWatcher:
+    def __init__(self, path, registry, interval=WATCH_INTERVAL):
+        self.path = path
+        self.registry = registry
+        self.interval = interval
+        # File name -> size, mtime_ns, content key and, for CSVs, the read
+        # position with the header and a hash of the bytes before it
+        self.files = {}
+        self.updates = 0
+        self.last_scan = None
+        self.last_update = None
+        self.last_error = None
+        self._handle = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # Load the directory and keep refreshing it in a background thread.
+    # Raises when the first load fails, e.g. for an empty directory.
+    def start(self):
+        self.scan()
+        if self._handle is None:
+            raise ValueError(f"No sales files found in {self.path}")
+        self._thread = threading.Thread(target=self._run, name=f"revify-watch-{os.path.basename(self.path)}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.scan()
+            except Exception as e:
+                self.last_error = str(e)
+                logger.exception("Error refreshing %s: %s", self.path, e)
+
+    # Content key of the current dataset, which changes with every update
+    @property
+    def version(self):
+        handle = self._handle
+        return handle.key if handle is not None else None
+
+    # A session's own handle to the current dataset, or None
+    def open(self):
+        handle = self._handle
+        if handle is None:
+            return None
+        return self.registry.open(handle.key, lambda: (None, None))
+
+    def status(self):
+        handle = self._handle
+        data = handle.dataset.data if handle is not None else None
+        return {
+            'files': len(self.files),
+            'rows': len(data) if data is not None else None,
+            'updates': self.updates,
+            'last_scan': self.last_scan,
+            'last_update': self.last_update,
+            'last_error': self.last_error,
+        }
+
+    # Check the directory once and ingest what changed. Returns True when
+    # the dataset was updated.
+    def scan(self):
+        with self._lock:
+            names = self._list_files()
+            settled = {
+                name: stat for name, stat in names.items()
+                if time.time() - stat.st_mtime >= WATCH_SETTLE_SECONDS
+            }
+            if self._handle is None or any(name not in names for name in self.files):
+                changed = self._rebuild(settled)
+            else:
+                changed = self._append(settled)
+            self.last_scan = time.time()
+            # Files that could not be ingested stay listed until they change
+            self.last_error = '; '.join(
+                f"{name}: {state['error']}" for name, state in self.files.items() if state.get('error')
+            ) or None
+            return changed
+
+    # Watched files in the directory by name, oldest first
+    def _list_files(self):
+        files = []
+        for entry in os.scandir(self.path):
+            if entry.is_file() and entry.name.endswith(WATCH_SUFFIXES) and not entry.name.startswith('.'):
+                stat = entry.stat()
+                files.append((stat.st_mtime_ns, entry.name, stat))
+        return {name: stat for _, name, stat in sorted(files)}
+
+    # Ingest new files and rows added to the end of known CSVs
+    def _append(self, settled):
+        columns = self._handle.dataset.data.columns
+        deltas = []
+        states = {}
+        for name, stat in settled.items():
+            state = self.files.get(name)
+            if state is not None and (stat.st_size, stat.st_mtime_ns) == (state['size'], state['mtime_ns']):
+                continue
+            try:
+                # Files none of whose rows were ingested yet are read whole;
+                # the others from where their last good read stopped
+                if state is None or state['key'] is None:
+                    rows, new_state = self._read_file(name, stat)
+                else:
+                    rows, new_state = self._read_change(name, stat, state)
+                    if new_state is None:
+                        return self._rebuild(settled)
+                if new_state is None:
+                    continue
+                if rows is not None and len(rows):
+                    deltas.append(conform_rows(rows, columns))
+            except Exception as e:
+                # Remember the file so a bad drop is not read again until it changes
+                new_state = self._reject(name, stat, e, state)
+            states[name] = new_state
+
+        if not states:
+            return False
+        if deltas:
+            self._swap(self.registry.append(self._handle, combine_frames(deltas), _files_key(states)))
+        self.files.update(states)
+        return bool(deltas)
+
+    # Read every file again into a new dataset
+    def _rebuild(self, settled):
+        frames = []
+        states = {}
+        for name, stat in settled.items():
+            try:
+                rows, state = self._read_file(name, stat)
+                if state is None:
+                    continue
+                if len(rows):
+                    frames.append(rows if not frames else conform_rows(rows, frames[0].columns))
+            except Exception as e:
+                state = self._reject(name, stat, e)
+            states[name] = state
+        if not frames:
+            self.files = states
+            return False
+
+        def load():
+            return sort_by_date(combine_frames(frames)), None
+
+        self._swap(self.registry.open(_files_key(states), load))
+        self.files = states
+        return True
+
+    # State of a file whose change could not be ingested. A file with rows
+    # already in the data keeps its last good read position, so its next
+    # change is read from there again.
+    def _reject(self, name, stat, error, state=None):
+        logger.warning("Skipping %s: %s", os.path.join(self.path, name), error)
+        if state is None or state['key'] is None:
+            state = {'key': None, 'offset': None}
+        return dict(state, size=stat.st_size, mtime_ns=stat.st_mtime_ns, error=str(error))
+
+    # Make handle the current dataset and release the previous one
+    def _swap(self, handle):
+        if handle is None:
+            return
+        previous, self._handle = self._handle, handle
+        if previous is not None:
+            previous.release()
+        self.updates += 1
+        self.last_update = time.time()
+
+    # Rows of a whole file and its state, or (None, None) when the file
+    # changed while it was read and should be read again later. CSVs are
+    # read up to their last line break like appended rows are.
+    def _read_file(self, name, stat):
+        path = os.path.join(self.path, name)
+        if name.endswith('.parquet'):
+            rows = sort_by_date(optimize_dtypes(pd.read_parquet(path)))
+            state = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'key': file_key(path)}
+        elif _ends_with_newline(path, stat.st_size):
+            rows = load_cached_csv(path)
+            state = self._csv_state(path, stat, file_key(path), stat.st_size)
+        else:
+            # A row is still being written; it is read with the next change
+            with open(path, 'rb') as handle:
+                content = handle.read(stat.st_size)
+            end = content.rfind(b'\n') + 1
+            if not end:
+                return None, None
+            rows = read_sales_csv(io.BytesIO(content[:end]))
+            state = self._csv_state(path, stat, hashlib.sha256(content[:end]).hexdigest(), end)
+        if os.stat(path).st_mtime_ns != stat.st_mtime_ns:
+            return None, None
+        return rows, state
+
+    # Rows added to the end of a CSV since it was last read, with its new
+    # state. The state is None when the file changed in any other way.
+    # (None, state) means the content is unchanged or no complete row was
+    # added yet.
+    def _read_change(self, name, stat, state):
+        path = os.path.join(self.path, name)
+        if name.endswith('.parquet'):
+            key = file_key(path)
+            if key != state['key']:
+                return None, None
+            return None, dict(state, size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+        if stat.st_size < state['offset']:
+            return None, None
+
+        with open(path, 'rb') as handle:
+            if handle.readline() != state['header']:
+                return None, None
+            start = max(state['offset'] - TAIL_CHECK_BYTES, 0)
+            handle.seek(start)
+            if hashlib.sha1(handle.read(state['offset'] - start)).hexdigest() != state['tail_hash']:
+                return None, None
+            added = handle.read(stat.st_size - state['offset'])
+
+        # Only complete lines; a partly written row is read next time
+        end = added.rfind(b'\n') + 1
+        if not end:
+            return None, dict(state, size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+        rows = read_sales_csv(io.BytesIO(state['header'] + added[:end]))
+        key = hashlib.sha256(f"{state['key']}+{hashlib.sha1(added[:end]).hexdigest()}".encode()).hexdigest()
+        return rows, self._csv_state(path, stat, key, state['offset'] + end)
+
+    # State of a CSV read up to offset
+    def _csv_state(self, path, stat, key, offset):
+        with open(path, 'rb') as handle:
+            header = handle.readline()
+            start = max(offset - TAIL_CHECK_BYTES, 0)
+            handle.seek(start)
+            tail_hash = hashlib.sha1(handle.read(offset - start)).hexdigest()
+        return {
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'key': key,
+            'offset': offset,
+            'header': header,
+            'tail_hash': tail_hash,
+        }
+
+
+# Whether a file's first size bytes end with a line break
+def _ends_with_newline(path, size):
+    if not size:
+        return False
+    with open(path, 'rb') as handle:
+        handle.seek(size - 1)
+        return handle.read(1) == b'\n'
+
+
+# Content key for a set of file states
+def _files_key(states):
+    parts = sorted((name, state['key'], state.get('offset')) for name, state in states.items())
+    return hashlib.sha256(json.dumps(parts).encode()).hexdigest()